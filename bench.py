@@ -0,0 +1,333 @@
+"""Micro-benchmarks for dmspace's hot paths, run outside the served app.
+
+    python bench.py                  # every benchmark
+    python bench.py crisis trends    # just these
+
+Each benchmark builds its own data (and SQLite files in a temp dir) and
+prints one table.
+"""
+import argparse
+import functools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# dmspace.py is a Streamlit script: importing it runs the app in bare mode,
+# so point its SQLite store somewhere disposable first
+os.environ.setdefault("DMSPACE_DB", os.path.join(tempfile.mkdtemp(prefix="dmspace-bench-"), "dmspace.db"))
+
+import numpy as np
+import pandas as pd
+
+from dmspace import (
+    CRISIS_KEYWORDS, JOURNAL_MOODS, JOURNAL_TIMESTAMP_FORMAT, PROFILE_STAGES, PUZZLE_MAX_LENGTH, PUZZLE_MIN_LENGTH,
+    RECORD_APPEND, STAGE_CODES, THEME_BITS, THEME_KEYWORDS, TREND_MAX_POINTS, TREND_RANGES, WELLNESS_WORDS_PATH,
+    ChatMessage, JournalEntry, PhraseMatcher, PuzzleEngine, SessionStore, batch_scores, compute_trends,
+    decode_record, is_possible_crisis, match_score, now_epoch, random_profiles, theme_mask, trend_series,
+)
+
+def benchmark_crisis_matcher(text_sizes=(1_000, 10_000, 100_000), phrase_counts=(16, 1_000, 5_000)):
+    """Time the matcher per input size and phrase count, and is_possible_crisis end to end; ns/char should stay flat"""
+    rng = random.Random(7)
+    vocabulary = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 8))) for _ in range(2_000)]
+    rows = []
+    for count in phrase_counts:
+        phrases = list(CRISIS_KEYWORDS) + [
+            " ".join(rng.sample(vocabulary, rng.randint(2, 4))) for _ in range(max(count - len(CRISIS_KEYWORDS), 0))
+        ]
+        started = time.perf_counter()
+        matcher = PhraseMatcher(phrases)
+        build_ms = (time.perf_counter() - started) * 1000
+        for size in text_sizes:
+            words, length = [], 0
+            while length < size:
+                word = rng.choice(vocabulary)
+                words.append(word)
+                length += len(word) + 1
+            text = " ".join(words)[:size]
+            started = time.perf_counter()
+            matcher.find(text)
+            elapsed = time.perf_counter() - started
+            rows.append({
+                "path": "PhraseMatcher.find",
+                "phrases": len(phrases),
+                "chars": size,
+                "build_ms": round(build_ms, 1),
+                "match_ms": round(elapsed * 1000, 2),
+                "ns_per_char": round(elapsed * 1e9 / size, 1),
+            })
+
+    # What a chat message pays: the cached matcher lookup plus the pass
+    is_possible_crisis("warm up")
+    for size in text_sizes:
+        text = " ".join(rng.choice(vocabulary) for _ in range(size // 4))[:size]
+        started = time.perf_counter()
+        is_possible_crisis(text)
+        elapsed = time.perf_counter() - started
+        rows.append({
+            "path": "is_possible_crisis",
+            "phrases": len(CRISIS_KEYWORDS),
+            "chars": size,
+            "build_ms": None,
+            "match_ms": round(elapsed * 1000, 2),
+            "ns_per_char": round(elapsed * 1e9 / size, 1),
+        })
+    return rows
+
+def benchmark_batch_scoring(sizes=(100_000, 1_000_000)):
+    """Profiles scored per second: scalar match_score vs one vectorized call"""
+    rng = np.random.default_rng(0)
+    query = random_profiles(1, seed=2)[0]
+    sample = random_profiles(10_000, seed=3)
+    started = time.perf_counter()
+    for other in sample:
+        match_score(query, other)
+    scalar_rate = len(sample) / (time.perf_counter() - started)
+
+    rows = []
+    for n in sizes:
+        masks = rng.integers(1, 1 << len(THEME_BITS), size=n, dtype=np.uint8)
+        stages = rng.integers(0, len(PROFILE_STAGES), size=n, dtype=np.int8)
+        started = time.perf_counter()
+        batch_scores(masks, stages, theme_mask(query), STAGE_CODES[query["stage"]])
+        elapsed = time.perf_counter() - started
+        rows.append({
+            "profiles": n,
+            "batch_ms": round(elapsed * 1000, 1),
+            "batch_per_sec": int(n / elapsed),
+            "scalar_per_sec": int(scalar_rate),
+            "speedup": round(n / elapsed / scalar_rate, 1),
+        })
+    return rows
+
+def benchmark_puzzle_engine(sizes=(10_000, 100_000), puzzles=1_000):
+    """Time index builds, dealing and guess checks for the shipped vocabulary and synthetic ones"""
+    rng = random.Random(11)
+    with open(WELLNESS_WORDS_PATH, encoding="utf-8") as f:
+        vocabularies = [("shipped", f.read().split())]
+    for size in sizes:
+        vocabularies.append((f"synthetic {size:,}", [
+            "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(rng.randint(PUZZLE_MIN_LENGTH, PUZZLE_MAX_LENGTH)))
+            for _ in range(size)
+        ]))
+    rows = []
+    for label, words in vocabularies:
+        started = time.perf_counter()
+        engine = PuzzleEngine(words)
+        build_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        dealt = [engine.deal(1, rng)[0] for _ in range(puzzles)]
+        deal_us = (time.perf_counter() - started) * 1e6 / puzzles
+        started = time.perf_counter()
+        for scramble, answer in dealt:
+            engine.is_solution(scramble, answer)
+        check_us = (time.perf_counter() - started) * 1e6 / puzzles
+        rows.append({
+            "vocabulary": label,
+            "words": len(engine),
+            "build_ms": round(build_ms, 1),
+            "deal_us": round(deal_us, 1),
+            "check_us": round(check_us, 2),
+        })
+    return rows
+
+def benchmark_session_store(session_counts=(1, 8, 32), appends=250):
+    """Appends/s with sessions writing at once: write-behind batches vs a commit per append"""
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for sessions in session_counts:
+            results = {}
+            for mode in ("batched", "per_commit"):
+                path = os.path.join(tmp, f"{mode}-{sessions}.db")
+                store = SessionStore(path)
+                conn = SessionStore._connect(path) if mode == "per_commit" else None
+                conn_lock = threading.Lock()
+
+                def write(session_id):
+                    for seq in range(appends):
+                        record = ChatMessage("user", f"message {seq} from {session_id}", now_epoch())
+                        if conn is None:
+                            store.append(session_id, "messages", record)
+                        else:
+                            with conn_lock:
+                                conn.execute(RECORD_APPEND, (session_id, "messages", json.dumps(record)))
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=sessions) as pool:
+                    list(pool.map(write, [f"bench-{i}" for i in range(sessions)]))
+                store.flush()
+                elapsed = time.perf_counter() - started
+                assert sum(store.count(f"bench-{i}", "messages") for i in range(sessions)) == sessions * appends
+                results[mode] = (sessions * appends / elapsed, store.batches)
+                if conn is not None:
+                    conn.close()
+                store.close()
+            rows.append({
+                "sessions": sessions,
+                "appends": sessions * appends,
+                "batched_per_s": round(results["batched"][0]),
+                "transactions": results["batched"][1],
+                "per_commit_per_s": round(results["per_commit"][0]),
+            })
+    return rows
+
+def benchmark_journal_search(sessions=20, years=3, pages=5):
+    """Query times over sessions with a daily entry for years, the last session searched"""
+    rng = random.Random(5)
+    words = ["work", "sleep", "family", "friend", "walk", "tired", "hopeful", "anxious", "calm", "exam",
+             "music", "rain", "coffee", "mom", "gym", "deadline", "grateful", "lonely", "laugh", "cook"]
+    days = 365 * years
+    start = time.time() - days * 86400
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(os.path.join(tmp, "journal.db"))
+        for i in range(sessions):
+            for day in range(days):
+                store.append(f"bench-{i}", "journal_entries", JournalEntry(
+                    text=" ".join(rng.choice(words) for _ in range(rng.randint(20, 60))),
+                    highlight=" ".join(rng.choice(words) for _ in range(3)),
+                    mood=rng.choice(JOURNAL_MOODS),
+                    created_at=int(start + day * 86400),
+                ))
+        store.flush()
+
+        session_id = f"bench-{sessions - 1}"
+        cases = [
+            ("words", {"query": "deadline tired"}),
+            ("prefix", {"query": "anx"}),
+            ("words + mood", {"query": "family", "moods": ["😞", "😐"]}),
+            ("mood + last 90 days", {"moods": ["😊"], "since": time.time() - 90 * 86400}),
+            ("no match", {"query": "zebra"}),
+        ]
+        for label, kwargs in cases:
+            timings, found, cursor = [], 0, None
+            for _ in range(pages):
+                started = time.perf_counter()
+                entries, cursor = store.search_journal(session_id, cursor=cursor, **kwargs)
+                timings.append((time.perf_counter() - started) * 1000)
+                found += len(entries)
+                if cursor is None:
+                    break
+            rows.append({
+                "query": label,
+                "indexed": sessions * days,
+                "pages": len(timings),
+                "results": found,
+                "first_page_ms": round(timings[0], 2),
+                "last_page_ms": round(timings[-1], 2),
+            })
+        store.close()
+    return rows
+
+def benchmark_trends(year_counts=(1, 3, 10)):
+    """Rollup and per-rerun chart cost as daily history grows"""
+    rng = np.random.default_rng(3)
+    metrics = [f"mood:{m}" for m in JOURNAL_MOODS] + [f"theme:{t}" for t in THEME_KEYWORDS] + ["gratitude"]
+    today = datetime.now().toordinal()
+    rows = []
+    for years in year_counts:
+        days = np.arange(today - 365 * years, today + 1)
+        daily = [
+            (metric, int(day), int(count))
+            for metric in metrics
+            for day, count in zip(days, rng.poisson(0.4, len(days)))
+            if count
+        ]
+        started = time.perf_counter()
+        trends = compute_trends(daily, today)
+        compute_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        for weeks in TREND_RANGES.values():
+            trend_series(trends, "mood:", weeks)
+            trend_series(trends, "theme:", weeks, averaged=True)
+            trend_series(trends, "gratitude", weeks)
+        chart_ms = (time.perf_counter() - started) * 1000 / len(TREND_RANGES)
+        rows.append({
+            "years": years,
+            "daily_rows": len(daily),
+            "weeks": trends["weekly"].shape[1],
+            "rollup_ms": round(compute_ms, 2),
+            "charts_ms": round(chart_ms, 2),
+            "max_points": TREND_MAX_POINTS,
+        })
+    return rows
+
+def benchmark_record_memory(count=100_000):
+    """Traced bytes for count records as loaded from the store: the old dicts vs the record types"""
+    rng = random.Random(11)
+    words = ["today", "work", "tired", "friend", "family", "sleep", "better", "worried", "talk", "walk",
+             "exam", "really", "feel", "just", "think", "calm", "home", "music", "week", "again"]
+    started = time.time() - count * 60
+
+    def text(low, high):
+        return " ".join(rng.choice(words) for _ in range(rng.randint(low, high)))
+
+    cases = {"messages": [], "journal_entries": []}
+    for i in range(count):
+        created_at = started + i * 60
+        stamp = datetime.fromtimestamp(created_at).strftime(JOURNAL_TIMESTAMP_FORMAT)
+        role, content = ("user", "assistant")[i % 2], text(5, 40)
+        cases["messages"].append((
+            json.dumps({"role": role, "content": content}, ensure_ascii=False),
+            json.dumps(ChatMessage(role, content, int(created_at)), ensure_ascii=False),
+        ))
+        entry = {"text": text(20, 60), "highlight": text(2, 6), "mood": rng.choice(JOURNAL_MOODS)}
+        cases["journal_entries"].append((
+            json.dumps({**entry, "timestamp": stamp, "created_at": created_at}, ensure_ascii=False),
+            json.dumps(JournalEntry(**entry, created_at=int(created_at)), ensure_ascii=False),
+        ))
+
+    def traced(load, payloads):
+        tracemalloc.start()
+        try:
+            loaded = [load(payload) for payload in payloads]
+            return tracemalloc.get_traced_memory()[0], loaded
+        finally:
+            tracemalloc.stop()
+
+    rows = []
+    for kind, payloads in cases.items():
+        before, _ = traced(json.loads, [old for old, _ in payloads])
+        after, loaded = traced(functools.partial(decode_record, kind), [new for _, new in payloads])
+        assert len(loaded) == count
+        rows.append({
+            "records": f"{count:,} {kind}",
+            "dicts_mb": round(before / 1e6, 1),
+            "records_mb": round(after / 1e6, 1),
+            "bytes_per_record": f"{before // count} → {after // count}",
+            "saved": f"{1 - after / before:.0%}",
+        })
+    return rows
+
+BENCHMARKS = {
+    "crisis": benchmark_crisis_matcher,
+    "batch": benchmark_batch_scoring,
+    "puzzles": benchmark_puzzle_engine,
+    "store": benchmark_session_store,
+    "journal": benchmark_journal_search,
+    "trends": benchmark_trends,
+    "records": benchmark_record_memory,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", metavar="name",
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    names = parser.parse_args(argv).names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+    for name in names:
+        func = BENCHMARKS[name]
+        print(f"== {name}: {func.__doc__}", flush=True)
+        print(pd.DataFrame(func()).to_string(index=False), end="\n\n", flush=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,162 @@
 #import libraries
 import os
-from datetime import datetime
+import asyncio
+import atexit
+from datetime import datetime, timedelta
 import hashlib
 import time
 import random
-
+import secrets
+import json
+import logging
+import queue
+import tempfile
+import functools
+import heapq
+import html
+import itertools
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import CancelledError
+from typing import NamedTuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
 import streamlit as st
+import streamlit.components.v1 as components
+import httpx
 import openai
-from openai import OpenAI
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+APP_RUN_STARTED = time.perf_counter()
+logger = logging.getLogger(__name__)
 
 
 #Load env + configure API client
 
 load_dotenv()
 
+# Connection pool for the shared OpenAI client (one per server process); every
+# call runs on one background asyncio loop, see OpenAIRunner
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "60"))
+
+@st.cache_resource(show_spinner=False)
+def get_http_client():
+    """Process-wide HTTP client so reruns and sessions reuse warm connections"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client(key):
+    """One OpenAI client per API key, shared by every rerun and session"""
+    return AsyncOpenAI(api_key=key, http_client=get_http_client())
+
+class OpenAIRunner:
+    """A background asyncio loop that runs every OpenAI call in the process.
+
+    Calls from all sessions share the loop and the connection pool, so they
+    run concurrently without a thread each. A session has at most one call
+    per purpose ("reply", "summary", "journal_prompts"): submitting a new one
+    cancels the call it supersedes, and a cancelled stream closes its HTTP
+    response right away instead of reading a reply no one will see.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="dmspace-openai-loop", daemon=True)
+        self._thread.start()
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.superseded = 0
+
+    def submit(self, session_id, purpose, coro):
+        """Schedule coro as the session's current call for purpose; returns its concurrent Future"""
+        self.cancel(session_id, purpose)
+        key = (session_id, purpose)
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        with self._lock:
+            self._calls[key] = future
+        future.add_done_callback(functools.partial(self._forget, key))
+        return future
+
+    def cancel(self, session_id, purpose):
+        """Cancel the session's call for purpose if it's still running"""
+        with self._lock:
+            future = self._calls.get((session_id, purpose))
+        # Outside the lock: cancel() runs the done callbacks, _forget included
+        if future is not None and not future.done() and future.cancel():
+            with self._lock:
+                self.superseded += 1
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def in_flight(self):
+        with self._lock:
+            return sum(1 for future in self._calls.values() if not future.done())
+
+@st.cache_resource(show_spinner=False)
+def get_openai_runner():
+    return OpenAIRunner()
+
+async def stream_completion(model, messages, chunks):
+    """Stream a reply's text into chunks, then None; cancelling closes the response"""
+    try:
+        stream = await client.chat.completions.create(model=model, messages=messages, stream=True)
+        async with stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks.put(chunk.choices[0].delta.content)
+    finally:
+        chunks.put(None)
+
+def iter_stream(future, chunks):
+    """A background stream's text on the script thread; stopping early cancels the stream"""
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+        future.result()
+    finally:
+        # A rerun (say, the user sent another message) closes this generator mid-reply
+        future.cancel()
+
+def get_pool_stats():
+    """Open, idle and in-use connections in the shared pool"""
+    pool = getattr(getattr(get_http_client(), "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", None) or [])
+    open_count = sum(1 for conn in connections if not conn.is_closed())
+    idle_count = sum(1 for conn in connections if conn.is_idle())
+    return {
+        "open": open_count,
+        "idle": idle_count,
+        "in_use": max(open_count - idle_count, 0),
+        "max_connections": OPENAI_MAX_CONNECTIONS,
+        "max_keepalive": OPENAI_MAX_KEEPALIVE,
+    }
+
 # Try to get API key from environment, then from streamlit secrets
 api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
@@ -25,7 +167,7 @@ if not api_key:
 
 if api_key is not None:
     openai.api_key = api_key
-    client = OpenAI(api_key=api_key)
+    client = get_openai_client(api_key)
     DEMO_MODE = False
 else:
     client = None
@@ -62,20 +204,996 @@ CULTURAL_CONTEXTS = {
     }
 }
 
+# ============ STATIC ASSETS ============
+
+ASSET_SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+STATIC_ASSETS = ("theme.css", "logo.svg")
+
+@st.cache_resource(show_spinner=False)
+def asset_build_dir():
+    """A fresh directory only this process can write to, removed at exit.
+
+    Everything in it is served on the app's origin, so it must never be a
+    shared, guessable path another user could fill first.
+    """
+    path = tempfile.mkdtemp(prefix="dmspace-assets-")
+    atexit.register(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+@st.cache_resource(show_spinner=False)
+def publish_static_assets():
+    """Copy the assets to content-hashed names once per process.
+
+    A changed file gets a new name, so browsers can cache each one forever.
+    """
+    build_dir = asset_build_dir()
+    published = {}
+    for name in STATIC_ASSETS:
+        with open(os.path.join(ASSET_SOURCE_DIR, name), "rb") as f:
+            data = f.read()
+        stem, ext = os.path.splitext(name)
+        hashed_name = f"{stem}.{hashlib.md5(data).hexdigest()[:12]}{ext}"
+        with open(os.path.join(build_dir, hashed_name), "wb") as f:
+            f.write(data)
+        published[name] = {"file": hashed_name, "text": data.decode()}
+    return published
+
+def static_asset_urls():
+    """Browser URLs for the published assets, served by Streamlit's component file route.
+
+    Streamlit's own static serving sends anything but images as text/plain
+    with nosniff, which browsers refuse as a stylesheet or SVG image.
+    """
+    published = publish_static_assets()
+    server = components.declare_component("dmspace_assets", path=asset_build_dir())
+    return {name: f"component/{server.name}/{info['file']}" for name, info in published.items()}
+
+def asset_stylesheet_markup(urls):
+    return f'<style>@import url("{urls["theme.css"]}");</style>'
+
+def asset_logo_markup(urls):
+    return (
+        '<div style="text-align: center; margin-bottom: 3rem;">'
+        f'<img src="{urls["logo.svg"]}" width="120" height="120" alt="DMSpace logo">'
+        "</div>"
+    )
+
+def asset_bytes_per_rerun():
+    """(inline bytes, referenced bytes) that the theme and logo add to every rerun"""
+    published = publish_static_assets()
+    inline = (
+        f'<style>\n{published["theme.css"]["text"]}</style>'
+        f'<div style="text-align: center; margin-bottom: 3rem;">{published["logo.svg"]["text"]}</div>'
+    )
+    urls = static_asset_urls()
+    referenced = asset_stylesheet_markup(urls) + asset_logo_markup(urls)
+    return len(inline.encode()), len(referenced.encode())
+
+# ============ RECORDS ============
+
+# History records are named tuples rather than dicts: no per-record key table,
+# repeated strings (roles, moods, senders) interned, times as epoch seconds.
+# The store keeps them as JSON arrays; times are only formatted when shown.
+
+class ChatMessage(NamedTuple):
+    role: str
+    content: str
+    created_at: int = 0
+
+    @classmethod
+    def load(cls, role, content, created_at=0):
+        return cls(sys.intern(role), content, int(created_at))
+
+class EmotionEntry(NamedTuple):
+    user_text: str
+    assistant_text: str
+    created_at: int = 0
+
+    @classmethod
+    def load(cls, user_text="", assistant_text="", created_at=0):
+        return cls(user_text, assistant_text, int(created_at))
+
+class JournalEntry(NamedTuple):
+    text: str
+    highlight: str
+    mood: str
+    created_at: int = 0
+
+    @classmethod
+    def load(cls, text="", highlight="", mood="", created_at=0):
+        return cls(text, highlight, sys.intern(mood), int(created_at))
+
+class GratitudeItem(NamedTuple):
+    text: str
+    day: int  # ordinal of the user's calendar day it was added on
+    created_at: int = 0
+
+    @classmethod
+    def load(cls, text, day, created_at=0):
+        return cls(text, int(day), int(created_at))
+
+class PeerMessage(NamedTuple):
+    seq: int
+    sender: str
+    text: str
+    created_at: int
+
+RECORD_TYPES = {
+    "messages": ChatMessage,
+    "emotion_log": EmotionEntry,
+    "journal_entries": JournalEntry,
+    "gratitude_jar": GratitudeItem,
+}
+
+def now_epoch():
+    return int(time.time())
+
+def decode_record(kind, payload):
+    """A stored record as its type"""
+    return RECORD_TYPES[kind].load(*json.loads(payload))
+
+def format_timestamp(created_at):
+    """Display form of epoch seconds, in the user's timezone"""
+    return datetime.fromtimestamp(created_at, user_timezone()).strftime(JOURNAL_TIMESTAMP_FORMAT)
+
+# ============ DURABLE STORAGE ============
+
+# Histories and game counters outlive the browser session in SQLite; set DMSPACE_DB to move it
+STORE_DB_PATH = os.getenv("DMSPACE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dmspace.db"))
+STORE_FLUSH_SECONDS = float(os.getenv("STORE_FLUSH_SECONDS", "0.25"))
+STORE_BATCH_SIZE = 500
+# A batch that fails is retried this many times, then written append by append so one bad write can't sink the rest
+STORE_WRITE_ATTEMPTS = 3
+STORE_RETRY_SECONDS = 0.5
+# Records of each history a session keeps in memory; older ones are read back on demand
+STORE_MEMORY_RECORDS = int(os.getenv("STORE_MEMORY_RECORDS", "200"))
+STORED_LOGS = ("messages", "emotion_log", "journal_entries", "gratitude_jar")
+STORED_VALUES = (
+    "theme_stats", "my_user_id", "conversation_summary", "word_game_score",
+    "gratitude_streak", "gratitude_best_streak", "gratitude_last_date", "breathing_sessions", "breathing_total_time",
+)
+
+JOURNAL_MOODS = ["😞", "😐", "🙂", "😊", "😌", "💪"]
+JOURNAL_TIMESTAMP_FORMAT = "%b %d, %Y • %I:%M %p"
+JOURNAL_SEARCH_PAGE_SIZE = 10
+
+# Journal entries are mirrored into a plain table for time/mood filters and an
+# FTS5 index over it for text; triggers keep the index in step with the table
+JOURNAL_SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal_index (
+    session_id TEXT NOT NULL, seq INTEGER NOT NULL, mood TEXT NOT NULL, created_at REAL NOT NULL,
+    text TEXT NOT NULL, highlight TEXT NOT NULL, UNIQUE (session_id, seq));
+CREATE INDEX IF NOT EXISTS journal_by_time ON journal_index (session_id, created_at, seq);
+CREATE VIRTUAL TABLE IF NOT EXISTS journal_fts USING fts5(
+    session_id, text, highlight, content='journal_index', content_rowid='rowid');
+CREATE TRIGGER IF NOT EXISTS journal_index_ai AFTER INSERT ON journal_index BEGIN
+    INSERT INTO journal_fts (rowid, session_id, text, highlight)
+    VALUES (new.rowid, new.session_id, new.text, new.highlight);
+END;
+CREATE TRIGGER IF NOT EXISTS journal_index_ad AFTER DELETE ON journal_index BEGIN
+    INSERT INTO journal_fts (journal_fts, rowid, session_id, text, highlight)
+    VALUES ('delete', old.rowid, old.session_id, old.text, old.highlight);
+END;
+CREATE TRIGGER IF NOT EXISTS journal_index_au AFTER UPDATE ON journal_index BEGIN
+    INSERT INTO journal_fts (journal_fts, rowid, session_id, text, highlight)
+    VALUES ('delete', old.rowid, old.session_id, old.text, old.highlight);
+    INSERT INTO journal_fts (rowid, session_id, text, highlight)
+    VALUES (new.rowid, new.session_id, new.text, new.highlight);
+END;
+"""
+# Appends take the next seq from the table inside the writer's transaction, so two
+# tabs on one session can't both claim a seq; the index row follows in the same batch
+RECORD_APPEND = (
+    "INSERT INTO records (session_id, kind, seq, payload)"
+    " SELECT ?1, ?2, COALESCE(MAX(seq) + 1, 0), ?3 FROM records WHERE session_id = ?1 AND kind = ?2"
+)
+JOURNAL_INDEX_APPEND = (
+    "INSERT INTO journal_index (session_id, seq, mood, created_at, text, highlight)"
+    " SELECT ?1, MAX(seq), ?2, ?3, ?4, ?5 FROM records WHERE session_id = ?1 AND kind = 'journal_entries'"
+)
+# Per-day counts behind the trends view, bumped in the same batch as each append
+DAILY_METRIC_PREFIXES = {"journal_entries": "mood:", "emotion_log": "theme:", "gratitude_jar": "gratitude"}
+DAILY_STATS_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS daily_stats ("
+    " session_id TEXT NOT NULL, metric TEXT NOT NULL, day INTEGER NOT NULL, count INTEGER NOT NULL,"
+    " PRIMARY KEY (session_id, metric, day)) WITHOUT ROWID"
+)
+DAILY_STATS_UPSERT = (
+    "INSERT INTO daily_stats (session_id, metric, day, count) VALUES (?, ?, ?, ?)"
+    " ON CONFLICT (session_id, metric, day) DO UPDATE SET count = count + excluded.count"
+)
+
+def daily_counts(kind, record):
+    """(metric, day ordinal, count) that appending record adds to the per-day aggregates.
+
+    Days are the user's (see user_timezone); outside a script run, as in
+    bench.py, they fall back to the server's.
+    """
+    if kind == "journal_entries":
+        return [("mood:" + record.mood, datetime.fromtimestamp(record.created_at, user_timezone()).toordinal(), 1)]
+    if kind == "emotion_log":
+        counts = count_themes(record.user_text, dict.fromkeys(THEME_KEYWORDS, 0))
+        day = datetime.fromtimestamp(record.created_at, user_timezone()).toordinal()
+        return [("theme:" + theme, day, n) for theme, n in counts.items() if n]
+    if kind == "gratitude_jar":
+        return [("gratitude", record.day, 1)]
+    return []
+
+def journal_snippet(text, terms, words=24, window=True):
+    """Bold the words that start with a search term, cut to a window around the first"""
+    if not terms:
+        return text
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(t) for t in terms) + r")\w*", re.IGNORECASE)
+    if window:
+        tokens = text.split()
+        first = next((i for i, token in enumerate(tokens) if pattern.search(token)), 0)
+        start = max(first - words // 4, 0)
+        text = ("… " if start else "") + " ".join(tokens[start:start + words]) + (" …" if start + words < len(tokens) else "")
+    return pattern.sub(lambda m: f"**{m.group(0)}**", text)
+
+class SessionStore:
+    """SQLite (WAL) home for per-session histories and values.
+
+    Writes are queued and applied behind the caller by one writer thread, a
+    batch per transaction, so appends never wait on the disk. Reads go
+    through their own connection and first wait for the session's own
+    queued writes (not everyone else's), so a session always reads its
+    own writes. A failed batch is retried and
+    then written one queued write at a time; writes that still fail are
+    logged and counted in dropped.
+    """
+
+    def __init__(self, path, flush_seconds=STORE_FLUSH_SECONDS, batch_size=STORE_BATCH_SIZE):
+        self._flush_seconds = flush_seconds
+        self._batch_size = batch_size
+        self._writer = self._connect(path)
+        self._writer.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " session_id TEXT NOT NULL, kind TEXT NOT NULL, seq INTEGER NOT NULL, payload TEXT NOT NULL,"
+            " PRIMARY KEY (session_id, kind, seq)) WITHOUT ROWID"
+        )
+        self._writer.execute(
+            "CREATE TABLE IF NOT EXISTS session_values ("
+            " session_id TEXT NOT NULL, name TEXT NOT NULL, value TEXT NOT NULL,"
+            " PRIMARY KEY (session_id, name)) WITHOUT ROWID"
+        )
+        self._writer.executescript(JOURNAL_SEARCH_SCHEMA)
+        self._writer.execute(DAILY_STATS_SCHEMA)
+        self._reader = self._connect(path)
+        self._read_lock = threading.Lock()
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._flush_requested = False
+        self._closed = False
+        self.queued = 0
+        # Per session, the value of queued after its latest write
+        self._marks = {}
+        self.written = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._write_behind, name="dmspace-store-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _connect(path):
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _enqueue(self, session_id, *ops):
+        """Queue (sql, params) statements that must land in the same transaction"""
+        with self._cond:
+            self._pending.append(ops)
+            self.queued += 1
+            self._marks[session_id] = self.queued
+            if len(self._pending) >= self._batch_size:
+                self._cond.notify_all()
+
+    def _write_behind(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                # Let a batch gather unless it's already full or someone is waiting on it
+                if len(self._pending) < self._batch_size and not self._flush_requested:
+                    self._cond.wait(self._flush_seconds)
+                batch = list(self._pending)
+                self._pending.clear()
+                self._flush_requested = False
+            dropped = 0
+            for attempt in range(1, STORE_WRITE_ATTEMPTS + 1):
+                try:
+                    self._apply(batch)
+                    break
+                except sqlite3.Error:
+                    logger.exception("Store batch of %d writes failed (attempt %d/%d)",
+                                     len(batch), attempt, STORE_WRITE_ATTEMPTS)
+                    time.sleep(STORE_RETRY_SECONDS * attempt)
+            else:
+                for ops in batch:
+                    try:
+                        self._apply([ops])
+                    except sqlite3.Error:
+                        logger.exception("Dropped store write: %s", ops[0][0])
+                        dropped += 1
+            with self._cond:
+                self.written += len(batch)
+                self.batches += 1
+                self.failed_batches += attempt > 1 or dropped > 0
+                self.dropped += dropped
+                # Batches land in queue order, so a session is caught up once written passes its mark
+                for session_id in [s for s, mark in self._marks.items() if mark <= self.written]:
+                    del self._marks[session_id]
+                self._cond.notify_all()
+
+    def _apply(self, batch):
+        """Run the batch's statements in one transaction, runs of the same statement together"""
+        try:
+            self._writer.execute("BEGIN IMMEDIATE")
+            for sql, ops in itertools.groupby(itertools.chain.from_iterable(batch), key=lambda op: op[0]):
+                self._writer.executemany(sql, [params for _, params in ops])
+            self._writer.execute("COMMIT")
+        except sqlite3.Error:
+            if self._writer.in_transaction:
+                self._writer.execute("ROLLBACK")
+            raise
+
+    def flush(self, session_id=None, timeout=10):
+        """Wait until everything queued so far, or just session_id's writes, is on disk"""
+        with self._cond:
+            target = self.queued if session_id is None else self._marks.get(session_id, 0)
+            if self.written >= target:
+                return True
+            self._flush_requested = True
+            self._cond.notify_all()
+            if self._cond.wait_for(lambda: self.written >= target, timeout):
+                return True
+            logger.warning("Store flush gave up after %ss with %d writes still ahead of it", timeout, target - self.written)
+            return False
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.flush)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._writer.close()
+        self._reader.close()
+
+    def _read(self, session_id, sql, params):
+        self.flush(session_id)
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def append(self, session_id, kind, record):
+        """Queue record as the session's next kind record; the store picks its seq"""
+        ops = [(RECORD_APPEND, (session_id, kind, json.dumps(record, ensure_ascii=False)))]
+        if kind == "journal_entries":
+            ops.append((JOURNAL_INDEX_APPEND, (session_id, record.mood, record.created_at, record.text, record.highlight)))
+        ops.extend((DAILY_STATS_UPSERT, (session_id, metric, day, count)) for metric, day, count in daily_counts(kind, record))
+        self._enqueue(session_id, *ops)
+
+    def clear(self, session_id, kind):
+        ops = [("DELETE FROM records WHERE session_id = ? AND kind = ?", (session_id, kind))]
+        if kind == "journal_entries":
+            ops.append(("DELETE FROM journal_index WHERE session_id = ?", (session_id,)))
+        if kind in DAILY_METRIC_PREFIXES:
+            ops.append((
+                "DELETE FROM daily_stats WHERE session_id = ? AND metric LIKE ?",
+                (session_id, DAILY_METRIC_PREFIXES[kind] + "%"),
+            ))
+        self._enqueue(session_id, *ops)
+
+    def put_value(self, session_id, name, value):
+        self._enqueue(session_id, (
+            "INSERT OR REPLACE INTO session_values (session_id, name, value) VALUES (?, ?, ?)",
+            (session_id, name, json.dumps(value, ensure_ascii=False)),
+        ))
+
+    def count(self, session_id, kind):
+        rows = self._read(
+            session_id, "SELECT COALESCE(MAX(seq) + 1, 0) FROM records WHERE session_id = ? AND kind = ?", (session_id, kind)
+        )
+        return rows[0][0]
+
+    def counts(self, session_id):
+        """Record count of each kind the session has stored"""
+        rows = self._read(
+            session_id, "SELECT kind, MAX(seq) + 1 FROM records WHERE session_id = ? GROUP BY kind", (session_id,)
+        )
+        return dict(rows)
+
+    def range(self, session_id, kind, start, stop):
+        """Records with start <= seq < stop, oldest first"""
+        rows = self._read(
+            session_id, "SELECT payload FROM records WHERE session_id = ? AND kind = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (session_id, kind, start, stop),
+        )
+        return [decode_record(kind, payload) for payload, in rows]
+
+    def values(self, session_id):
+        rows = self._read(session_id, "SELECT name, value FROM session_values WHERE session_id = ?", (session_id,))
+        return {name: json.loads(value) for name, value in rows}
+
+    def daily_stats(self, session_id):
+        """(metric, day ordinal, count) rows for the session"""
+        return self._read(session_id, "SELECT metric, day, count FROM daily_stats WHERE session_id = ?", (session_id,))
+
+    def metric_days(self, session_id, metric, since=0):
+        """(day ordinal, count) for one metric from day since on, oldest first"""
+        return self._read(
+            session_id, "SELECT day, count FROM daily_stats WHERE session_id = ? AND metric = ? AND day >= ? ORDER BY day",
+            (session_id, metric, since),
+        )
+
+    def search_journal(self, session_id, query="", moods=(), since=None, until=None, cursor=None,
+                       limit=JOURNAL_SEARCH_PAGE_SIZE):
+        """One page of the session's journal entries, newest first, matching query and filters.
+
+        Every word in query matches as a prefix in the text or highlight;
+        since/until bound created_at. Returns (entries, cursor); pass the
+        cursor back for the next page. The cursor is None after the last page.
+        """
+        clauses, params = ["j.session_id = ?"], [session_id]
+        if moods:
+            clauses.append(f"j.mood IN ({', '.join('?' * len(moods))})")
+            params.extend(moods)
+        if since is not None:
+            clauses.append("j.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("j.created_at < ?")
+            params.append(until)
+        if cursor is not None:
+            clauses.append("(j.created_at, j.seq) < (?, ?)")
+            params.extend(cursor)
+
+        terms = re.findall(r"\w+", query)
+        if terms:
+            # The session id column narrows the index to this session's rows. CROSS JOIN
+            # keeps FTS driving; otherwise SQLite walks the session's entries by time
+            # and re-runs the MATCH for each one
+            match = f'session_id : "{session_id}" AND {{text highlight}} : (' + " ".join(f'"{t}"*' for t in terms) + ")"
+            sql = (
+                "SELECT j.seq, j.mood, j.created_at, j.text, j.highlight"
+                " FROM journal_fts CROSS JOIN journal_index j ON j.rowid = journal_fts.rowid WHERE journal_fts MATCH ? AND "
+            )
+            params.insert(0, match)
+        else:
+            sql = "SELECT j.seq, j.mood, j.created_at, j.text, j.highlight FROM journal_index j WHERE "
+        sql += " AND ".join(clauses) + " ORDER BY j.created_at DESC, j.seq DESC LIMIT ?"
+        rows = self._read(session_id, sql, params + [limit + 1])
+
+        # Snippets only for the page; FTS5's snippet() would run on every match before the sort
+        entries = [
+            {
+                "seq": seq, "mood": mood, "created_at": created_at,
+                "text": journal_snippet(text, terms), "highlight": journal_snippet(highlight, terms, window=False),
+            }
+            for seq, mood, created_at, text, highlight in rows[:limit]
+        ]
+        more = len(rows) > limit
+        return entries, ((entries[-1]["created_at"], entries[-1]["seq"]) if more else None)
+
+@st.cache_resource(show_spinner=False)
+def get_session_store():
+    return SessionStore(STORE_DB_PATH)
+
+class StoredLog:
+    """A session's append-only history that slices like a list.
+
+    Only the newest records stay in memory; indexing further back reads
+    them from the store. The in-memory tail can be resized from another
+    thread (see SessionMemory), so it is only touched under the lock.
+    Another tab of the same session appends to the same rows; sync
+    catches up with them.
+    """
+
+    def __init__(self, store, session_id, kind, keep=STORE_MEMORY_RECORDS):
+        self._store = store
+        self._session_id = session_id
+        self._kind = kind
+        self._lock = threading.Lock()
+        self._count = store.count(session_id, kind)
+        self._tail = deque(maxlen=keep)
+        self._sizes = deque(maxlen=keep)
+        self._fill(keep)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for start in range(0, self._count, STORE_BATCH_SIZE):
+            yield from self._slice(start, min(start + STORE_BATCH_SIZE, self._count))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._count)
+            records = self._slice(start, max(start, stop))
+            return records if step == 1 else records[::step]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("StoredLog index out of range")
+        return self._slice(index, index + 1)[0]
+
+    def _fill(self, keep):
+        """Read the records missing from a tail of keep back from the store"""
+        stop = self._count - len(self._tail)
+        start = max(self._count - keep, 0)
+        if start < stop:
+            older = self._store.range(self._session_id, self._kind, start, stop)
+            self._tail.extendleft(reversed(older))
+            self._sizes.extendleft(approx_size(record) for record in reversed(older))
+
+    def _slice(self, start, stop):
+        with self._lock:
+            base = self._count - len(self._tail)
+            older = self._store.range(self._session_id, self._kind, start, min(stop, base)) if start < base else []
+            recent = itertools.islice(self._tail, max(start - base, 0), max(stop - base, 0))
+            return older + list(recent)
+
+    @property
+    def in_memory(self):
+        return len(self._tail)
+
+    @property
+    def keep(self):
+        return self._tail.maxlen
+
+    @property
+    def nbytes(self):
+        """Approximate bytes held by the in-memory tail"""
+        return sum(self._sizes)
+
+    def resize(self, keep):
+        """Keep the newest keep records in memory, dropping or reloading the rest"""
+        with self._lock:
+            if keep == self._tail.maxlen:
+                return
+            self._tail = deque(itertools.islice(self._tail, max(len(self._tail) - keep, 0), None), maxlen=keep)
+            self._sizes = deque(itertools.islice(self._sizes, max(len(self._sizes) - keep, 0), None), maxlen=keep)
+            self._fill(keep)
+
+    def sync(self, count):
+        """Match a store now holding count records, reloading the tail if they differ"""
+        with self._lock:
+            if count == self._count:
+                return
+            # Another tab's records may sit between ours, so the whole tail is reread
+            self._count = count
+            self._tail.clear()
+            self._sizes.clear()
+            self._fill(self._tail.maxlen)
+
+    def append(self, record):
+        with self._lock:
+            self._store.append(self._session_id, self._kind, record)
+            self._tail.append(record)
+            self._sizes.append(approx_size(record))
+            self._count += 1
+
+    def clear(self):
+        with self._lock:
+            self._store.clear(self._session_id, self._kind)
+            self._tail.clear()
+            self._sizes.clear()
+            self._count = 0
+
+def auth_configured():
+    """True when secrets.toml has an [auth] section, so st.login can sign users in"""
+    try:
+        return "auth" in st.secrets
+    except Exception:
+        return False
+
+def account_session_id():
+    """A stable session id for the signed-in account, or None for a guest"""
+    if not auth_configured() or not st.user.get("is_logged_in"):
+        return None
+    account = f"{st.user.get('iss', '')}:{st.user.get('sub') or st.user.get('email')}"
+    return "u" + hashlib.sha256(account.encode()).hexdigest()[:40]
+
+def load_session_state():
+    """Attach this browser session to its stored history, then catch up with the store.
+
+    Only a signed-in account finds its history again on a later visit; its
+    id comes from the account and never appears in the URL. A guest's id is
+    random and held only in this session's state, so nothing copied from
+    the address bar or browser history can reopen it.
+
+    Two tabs signed in to one account share a session id and write to the
+    same rows. Every run rereads the record counts and stored values, so
+    each tab starts from what the other last wrote instead of its own copy.
+    """
+    store = get_session_store()
+    if "session_id" not in st.session_state:
+        # Older links carried the session id; drop it so it isn't shared further
+        st.query_params.pop("sid", None)
+        session_id = account_session_id()
+        st.session_state.signed_in = session_id is not None
+        st.session_state.session_id = session_id or secrets.token_urlsafe(16)
+        for kind in STORED_LOGS:
+            st.session_state[kind] = StoredLog(store, st.session_state.session_id, kind)
+    else:
+        counts = store.counts(st.session_state.session_id)
+        for kind in STORED_LOGS:
+            st.session_state[kind].sync(counts.get(kind, 0))
+    for name, value in store.values(st.session_state.session_id).items():
+        if name in STORED_VALUES:
+            st.session_state[name] = value
+
+def save_session_value(*names):
+    """Queue the current session_state values of names for the store"""
+    store = get_session_store()
+    for name in names:
+        store.put_value(st.session_state.session_id, name, st.session_state[name])
+
+# ============ SESSION MEMORY ============
+
+# Rough bytes one session may hold; past it, cold history drops back to the store
+SESSION_MEMORY_BUDGET = int(os.getenv("DMSPACE_SESSION_BUDGET", str(2 * 1024 * 1024)))
+# Sessions without a run for this long give up everything the store can rebuild
+SESSION_IDLE_SECONDS = float(os.getenv("DMSPACE_SESSION_IDLE", "900"))
+SESSION_SWEEP_SECONDS = 60.0
+SESSION_MIN_RECORDS = 20
+
+def approx_size(obj, seen=None):
+    """Rough deep size of obj in bytes; objects reached twice are counted once"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(key, seen) + approx_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(approx_size(item, seen) for item in obj)
+    return size
+
+class SessionMemory:
+    """Approximate bytes held by every live session, with idle eviction.
+
+    Each run reports its session's size and a release callback that drops
+    what can be rebuilt (see release_session). A sweeper thread calls it for
+    sessions idle past idle_seconds and forgets them, so closed tabs release
+    their history even before Streamlit lets go of their session state.
+    """
+
+    def __init__(self, idle_seconds=SESSION_IDLE_SECONDS, sweep_seconds=SESSION_SWEEP_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self._sweep_seconds = sweep_seconds
+        self._thread = threading.Thread(target=self._sweep, name="dmspace-session-sweeper", daemon=True)
+        self._thread.start()
+
+    def track(self, session_id, nbytes, release):
+        """Record a run of session_id; False if it was unknown or evicted since its last run"""
+        with self._lock:
+            known = session_id in self._sessions
+            self._sessions[session_id] = {"bytes": nbytes, "seen": time.monotonic(), "release": release}
+        return known
+
+    def touch(self, session_id):
+        """Count a run that didn't account memory as activity; False if session_id isn't tracked"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry["seen"] = time.monotonic()
+        return entry is not None
+
+    def sessions(self):
+        """(session_id, bytes, idle seconds) for every tracked session, largest first"""
+        now = time.monotonic()
+        with self._lock:
+            rows = [(session_id, entry["bytes"], now - entry["seen"]) for session_id, entry in self._sessions.items()]
+        return sorted(rows, key=lambda row: row[1], reverse=True)
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(entry["bytes"] for entry in self._sessions.values())
+
+    def evict_idle(self):
+        """Drop the rebuildable state of sessions idle too long; returns how many"""
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [session_id for session_id, entry in self._sessions.items() if entry["seen"] < cutoff]
+            for session_id in idle:
+                self._sessions.pop(session_id)["release"]()
+            self.evicted += len(idle)
+        return len(idle)
+
+    def _sweep(self):
+        while True:
+            time.sleep(self._sweep_seconds)
+            self.evict_idle()
+
+@st.cache_resource(show_spinner=False)
+def get_session_memory():
+    return SessionMemory()
+
+def session_memory_usage():
+    """Approximate bytes of this session's state, by session_state key"""
+    seen = set()
+    usage = {}
+    for key in st.session_state:
+        value = st.session_state[key]
+        usage[key] = value.nbytes if isinstance(value, StoredLog) else approx_size(value, seen)
+    return usage
+
+def trim_peer_chat_views(views):
+    """Cut every view back to its newest page; "Load earlier" pages the rest back in"""
+    for view in views.values():
+        if len(view["messages"]) > PEER_CHAT_PAGE_SIZE:
+            view["messages"] = view["messages"][-PEER_CHAT_PAGE_SIZE:]
+            view["cursor"] = view["messages"][0].seq or None
+
+def release_session(logs, views, peers, broker, peer_id):
+    """What an idle session gives up: history tails, peer chat views, and its place in peer matching"""
+    for log in logs:
+        log.resize(0)
+    # Views are rebuilt on demand, and rebuilding one subscribes again
+    views.clear()
+    broker.unsubscribe(peer_id)
+    peers.remove(peer_id)
+
+def track_session_memory():
+    """Account this session's memory after a run, compacting it down to the budget.
+
+    Cheapest to rebuild goes first: the trends cache, then peer chat
+    history beyond the newest page, then halving the in-memory tail of
+    every StoredLog down to SESSION_MIN_RECORDS. Once usage falls under
+    half the budget the tails double back toward STORE_MEMORY_RECORDS, a
+    step per run. A session evicted while idle gets its tails reloaded and
+    its peer profile back, opted in as before, on its next run.
+    """
+    if "session_id" not in st.session_state:
+        return
+    logs = [st.session_state[kind] for kind in STORED_LOGS]
+    views = st.session_state.get("peer_chat_views", {})
+    keep = st.session_state.setdefault("memory_keep", STORE_MEMORY_RECORDS)
+
+    nbytes = sum(session_memory_usage().values())
+    if nbytes > SESSION_MEMORY_BUDGET:
+        st.session_state.pop("trends", None)
+        trim_peer_chat_views(views)
+        nbytes = sum(session_memory_usage().values())
+    while nbytes > SESSION_MEMORY_BUDGET and keep > SESSION_MIN_RECORDS:
+        keep = max(keep // 2, SESSION_MIN_RECORDS)
+        for log in logs:
+            log.resize(keep)
+        nbytes = sum(session_memory_usage().values())
+    # Doubling tails that fit in half the budget can't push the session past it
+    if nbytes < SESSION_MEMORY_BUDGET // 2 and keep < STORE_MEMORY_RECORDS:
+        keep = min(keep * 2, STORE_MEMORY_RECORDS)
+        for log in logs:
+            log.resize(keep)
+        nbytes = sum(session_memory_usage().values())
+    st.session_state.memory_keep = keep
+
+    peers = get_peer_registry()
+    release = functools.partial(release_session, logs, views, peers, get_chat_store().broker, st.session_state.my_user_id)
+    if not get_session_memory().track(st.session_state.session_id, nbytes, release):
+        for log in logs:
+            log.resize(keep)
+        if st.session_state.my_user_id not in peers:
+            publish_profile()
+
+# ============ TRENDS ============
+
+TREND_RANGES = {"12 weeks": 12, "1 year": 52, "All time": None}
+TREND_MAX_POINTS = 52
+TREND_AVERAGE_WEEKS = 4
+
+def monday_of(days):
+    """Ordinal of the Monday starting each day's week (ordinal 1 was a Monday)"""
+    return days - (days - 1) % 7
+
+def compute_trends(rows, today):
+    """Weekly counts and trailing averages per metric from (metric, day, count) rows"""
+    metrics = sorted({metric for metric, _, _ in rows})
+    last_monday = int(monday_of(np.int64(today)))
+    if not rows:
+        return {"metrics": [], "weekly": np.zeros((0, 1)), "average": np.zeros((0, 1)), "first_monday": last_monday}
+
+    metric_index = {metric: i for i, metric in enumerate(metrics)}
+    which = np.fromiter((metric_index[metric] for metric, _, _ in rows), dtype=np.int64, count=len(rows))
+    days = np.fromiter((day for _, day, _ in rows), dtype=np.int64, count=len(rows))
+    counts = np.fromiter((count for _, _, count in rows), dtype=np.float64, count=len(rows))
+
+    first_monday = int(monday_of(days.min()))
+    weeks = (last_monday - first_monday) // 7 + 1
+    # Clock skew can date an entry past today; it lands in the current week
+    week = np.minimum((monday_of(days) - first_monday) // 7, weeks - 1)
+    weekly = np.zeros((len(metrics), weeks))
+    np.add.at(weekly, (which, week), counts)
+    return {
+        "metrics": metrics,
+        "weekly": weekly,
+        "average": moving_average(weekly, TREND_AVERAGE_WEEKS),
+        "first_monday": first_monday,
+    }
+
+def moving_average(matrix, window):
+    """Trailing mean over window columns; the first few average what they have"""
+    sums = np.cumsum(np.pad(matrix, ((0, 0), (1, 0))), axis=1)
+    hi = np.arange(1, matrix.shape[1] + 1)
+    lo = np.maximum(hi - window, 0)
+    return (sums[:, hi] - sums[:, lo]) / (hi - lo)
+
+def downsample(matrix, max_points, how="sum"):
+    """At most max_points columns, newest last: buckets are summed, or their last column kept"""
+    width = -(-matrix.shape[1] // max_points)
+    if width <= 1:
+        return matrix
+    if how == "last":
+        return matrix[:, ::-1][:, ::width][:, ::-1]
+    pad = -matrix.shape[1] % width
+    padded = np.pad(matrix, ((0, 0), (pad, 0)))
+    return padded.reshape(matrix.shape[0], -1, width).sum(axis=2)
+
+def trend_series(trends, prefix, weeks=None, averaged=False):
+    """Chart columns for the metrics under prefix over the last weeks, at most TREND_MAX_POINTS points"""
+    rows = [i for i, metric in enumerate(trends["metrics"]) if metric.startswith(prefix)]
+    if not rows:
+        return None
+    matrix = trends["average" if averaged else "weekly"][rows]
+    start = 0 if weeks is None else max(matrix.shape[1] - weeks, 0)
+    matrix = downsample(matrix[:, start:], TREND_MAX_POINTS, "last" if averaged else "sum")
+    # Each point is labelled with the last week it covers
+    week_starts = downsample(np.arange(start, trends["weekly"].shape[1])[None, :], TREND_MAX_POINTS, "last")[0]
+    data = {"week": [datetime.fromordinal(trends["first_monday"] + 7 * int(w)).strftime("%Y-%m-%d") for w in week_starts]}
+    for i, row in zip(rows, matrix):
+        data[trends["metrics"][i][len(prefix):] or prefix] = np.round(row, 2).tolist()
+    return data
+
+def get_trends():
+    """This session's trends, recomputed only when one of its histories has grown or the day turned"""
+    version = tuple(len(st.session_state[kind]) for kind in DAILY_METRIC_PREFIXES)
+    today = user_today().toordinal()
+    cached = st.session_state.get("trends")
+    if cached is None or cached["version"] != version or cached["today"] != today:
+        rows = get_session_store().daily_stats(st.session_state.session_id)
+        cached = st.session_state.trends = {"version": version, "today": today, **compute_trends(rows, today)}
+    return cached
+
+# ============ RERUN SCOPING ============
+
+RUN_TIMINGS_KEPT = 100
+
+def record_run_time(scope, started):
+    if "run_timings" not in st.session_state:
+        st.session_state.run_timings = deque(maxlen=RUN_TIMINGS_KEPT)
+    st.session_state.run_timings.append((scope, (time.perf_counter() - started) * 1000))
+
+def is_fragment_run():
+    """True while only fragments are rerunning, not the whole script"""
+    ctx = get_script_run_ctx()
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+def timed(scope):
+    """Record how long each run of the decorated tab or panel takes"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_run_time(scope, started)
+                # A full run accounts memory once, at the end of the script
+                if is_fragment_run():
+                    track_session_memory()
+        return wrapper
+    return decorator
+
+def rerun_fragment():
+    """Rerun only the current fragment; falls back to the whole app during a full run"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+# ============ DEFERRED FEEDBACK ============
+
+FLASH_SECONDS = 3.0
+
+def flash(slot, kind, text, seconds=FLASH_SECONDS):
+    """Queue a success/error/warning/info message for slot; it clears itself after seconds"""
+    if "flashes" not in st.session_state:
+        st.session_state.flashes = {}
+    st.session_state.flashes[slot] = {"kind": kind, "text": text, "expires": time.monotonic() + seconds}
+
+def show_flash(slot):
+    """Show slot's message, if any; the browser fades it out when it expires, so nothing polls"""
+    flashes = st.session_state.get("flashes", {})
+    message = flashes.get(slot)
+    if message is None:
+        return
+    remaining = message["expires"] - time.monotonic()
+    if remaining <= 0:
+        flashes.pop(slot, None)
+        return
+    # A rerun before expiry re-renders with the time left, so the fade still lands on time
+    st.markdown(
+        f'<div class="flash flash-{message["kind"]}" style="animation-delay: {remaining:.1f}s">'
+        f'{html.escape(message["text"])}</div>',
+        unsafe_allow_html=True,
+    )
+
 # ============ GAME 1: WORD GAME ============
 
-WELLNESS_WORDS = [
-    ("XAEITNY", "ANXIETY"),
-    ("MLAC", "CALM"),
-    ("VRABE", "BRAVE"),
-    ("ULFGRTA", "GRATEFUL"),
-    ("FULECAPE", "PEACEFUL"),
-    ("YJOYLF", "JOYFUL"),
-    ("RTOCOSMF", "COMFORT"),
-    ("EOHP", "HOPE"),
-    ("RTSONG", "STRONG"),
-    ("NEIHT", "INTENT"),
-]
+# One word per line; point DMSPACE_WORDS at a bigger list to widen the game
+WELLNESS_WORDS_PATH = os.getenv("DMSPACE_WORDS", os.path.join(ASSET_SOURCE_DIR, "wellness_words.txt"))
+WORD_GAME_ROUNDS = 5
+PUZZLE_MIN_LENGTH = 4
+PUZZLE_MAX_LENGTH = 9
+PUZZLE_SHUFFLE_TRIES = 20
+
+def letter_signature(word):
+    """Letters in sorted order; two words are anagrams exactly when these match"""
+    return "".join(sorted(word.upper()))
+
+class PuzzleEngine:
+    """Vocabulary indexed by letter signature, for scrambles and anagram checks"""
+
+    def __init__(self, words):
+        index = defaultdict(set)
+        for word in words:
+            word = word.strip().upper()
+            if word.isalpha():
+                index[letter_signature(word)].add(word)
+        self._solutions = {signature: frozenset(found) for signature, found in index.items()}
+        # A word made of one repeated letter can't be scrambled
+        self._answers = sorted(
+            word
+            for signature, found in self._solutions.items()
+            if PUZZLE_MIN_LENGTH <= len(signature) <= PUZZLE_MAX_LENGTH and len(set(signature)) > 1
+            for word in found
+        )
+
+    def __len__(self):
+        return sum(len(found) for found in self._solutions.values())
+
+    def solutions(self, scramble):
+        """Every vocabulary word that uses exactly the scramble's letters"""
+        return self._solutions.get(letter_signature(scramble), frozenset())
+
+    def is_solution(self, scramble, guess):
+        return guess.strip().upper() in self.solutions(scramble)
+
+    def scramble(self, answer, rng=random):
+        """Reorder answer's letters so they don't spell any solution"""
+        solutions = self.solutions(answer)
+        letters = list(answer)
+        for _ in range(PUZZLE_SHUFFLE_TRIES):
+            rng.shuffle(letters)
+            if "".join(letters) not in solutions:
+                return "".join(letters)
+        # Unlucky shuffles; walk the arrangements, which stops within a few when solutions are few
+        for arrangement in itertools.permutations(answer):
+            if "".join(arrangement) not in solutions:
+                return "".join(arrangement)
+        raise ValueError(f"every arrangement of {answer} is a solution")
+
+    def deal(self, count, rng=random):
+        """count (scramble, answer) puzzles with distinct answers"""
+        answers = rng.sample(self._answers, min(count, len(self._answers)))
+        return [(self.scramble(answer, rng), answer) for answer in answers]
+
+@st.cache_resource(show_spinner=False)
+def get_puzzle_engine():
+    with open(WELLNESS_WORDS_PATH, encoding="utf-8") as f:
+        return PuzzleEngine(f.read().split())
 
 def init_game_state():
     """Initialize all game states"""
@@ -84,7 +1202,7 @@ def init_game_state():
     if "word_game_current" not in st.session_state:
         st.session_state.word_game_current = 0
     if "word_game_words" not in st.session_state:
-        st.session_state.word_game_words = random.sample(WELLNESS_WORDS, 5)
+        st.session_state.word_game_words = get_puzzle_engine().deal(WORD_GAME_ROUNDS)
     if "word_game_guessed" not in st.session_state:
         st.session_state.word_game_guessed = False
     
@@ -94,25 +1212,45 @@ def init_game_state():
         st.session_state.gratitude_streak = 0
     if "gratitude_last_date" not in st.session_state:
         st.session_state.gratitude_last_date = None
+    if "gratitude_best_streak" not in st.session_state:
+        st.session_state.gratitude_best_streak = 0
     
     if "breathing_sessions" not in st.session_state:
         st.session_state.breathing_sessions = 0
     if "breathing_total_time" not in st.session_state:
         st.session_state.breathing_total_time = 0
 
+def submit_word_guess(scrambled, answer):
+    """Score the current guess and move straight on to the next word"""
+    guess = st.session_state.get(f"word_guess_{st.session_state.word_game_current}", "")
+    if not guess:
+        return
+    if get_puzzle_engine().is_solution(scrambled, guess):
+        if guess.strip().upper() == answer:
+            flash("word_game", "success", f"✅ Correct! It's {answer}!")
+        else:
+            flash("word_game", "success", f"✅ Correct! {guess.strip().upper()} works too (we had {answer}).")
+        st.session_state.word_game_score += 10
+        save_session_value("word_game_score")
+    else:
+        flash("word_game", "error", f"❌ Not quite. The answer is {answer}.")
+    st.session_state.word_game_current += 1
+    st.session_state.word_game_guessed = False
+
 def show_word_game():
     """Word unscramble game"""
     st.markdown("### 🔍 Word Detective")
     st.caption("Unscramble wellness words! 30 seconds per word.")
     
     init_game_state()
+    show_flash("word_game")
     
-    if st.session_state.word_game_current >= 5:
+    if st.session_state.word_game_current >= len(st.session_state.word_game_words):
         st.markdown(f"## 🎉 Game Complete!")
         st.markdown(f"""
         <div style="background: rgba(102, 126, 234, 0.2); border-radius: 12px; padding: 2rem; border: 1px solid rgba(102, 126, 234, 0.5); text-align: center;">
             <h2 style="color: #fff; margin: 0;">Final Score: {st.session_state.word_game_score}</h2>
-            <p style="color: rgba(255,255,255,0.9); margin-top: 1rem;">You unscrambled {st.session_state.word_game_current}/5 words!</p>
+            <p style="color: rgba(255,255,255,0.9); margin-top: 1rem;">You unscrambled {st.session_state.word_game_current}/{len(st.session_state.word_game_words)} words!</p>
         </div>
         """, unsafe_allow_html=True)
         
@@ -120,43 +1258,113 @@ def show_word_game():
         with col1:
             if st.button("Play Again", use_container_width=True, key="word_replay"):
                 st.session_state.word_game_score = 0
+                save_session_value("word_game_score")
                 st.session_state.word_game_current = 0
-                st.session_state.word_game_words = random.sample(WELLNESS_WORDS, 5)
+                st.session_state.word_game_words = get_puzzle_engine().deal(WORD_GAME_ROUNDS)
                 st.session_state.word_game_guessed = False
-                st.rerun()
+                rerun_fragment()
         with col2:
             if st.button("Back to Games", use_container_width=True, key="word_back"):
-                st.rerun()
+                rerun_fragment()
     else:
         scrambled, answer = st.session_state.word_game_words[st.session_state.word_game_current]
         
-        st.markdown(f"**Word {st.session_state.word_game_current + 1}/5**")
+        st.markdown(f"**Word {st.session_state.word_game_current + 1}/{len(st.session_state.word_game_words)}**")
         st.write(f"Score: {st.session_state.word_game_score}")
         
         st.markdown("")
         st.markdown(f"# {scrambled}")
+        solution_count = len(get_puzzle_engine().solutions(scrambled))
+        if solution_count > 1:
+            st.caption(f"{solution_count} words fit these letters; any of them counts.")
         
         col1, col2 = st.columns([2, 1])
         with col1:
-            guess = st.text_input("Your answer:", key=f"word_guess_{st.session_state.word_game_current}", label_visibility="collapsed")
+            st.text_input("Your answer:", key=f"word_guess_{st.session_state.word_game_current}", label_visibility="collapsed")
         with col2:
-            submit = st.button("Submit", use_container_width=True)
-        
-        if submit and guess:
-            if guess.upper() == answer:
-                st.success(f"✅ Correct! It's {answer}!")
-                st.session_state.word_game_score += 10
-                time.sleep(1.5)
-                st.session_state.word_game_current += 1
-                st.session_state.word_game_guessed = False
-                st.rerun()
-            else:
-                st.error(f"❌ Not quite. The answer is {answer}.")
-                time.sleep(1.5)
-                st.session_state.word_game_current += 1
-                st.session_state.word_game_guessed = False
-                st.rerun()
+            st.button("Submit", use_container_width=True, on_click=submit_word_guess, args=(scrambled, answer))
+
+
+GRATITUDE_HEATMAP_WEEKS = 26
+WEEKDAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+def user_timezone():
+    """The browser's timezone when Streamlit reports it, else None for the server's"""
+    name = getattr(getattr(st, "context", None), "timezone", None)
+    try:
+        return ZoneInfo(name) if name else None
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
 
+def user_today():
+    """Today's date where the user is now; a gratitude keeps the day it was added on"""
+    return datetime.now(user_timezone()).date()
+
+def record_gratitude_day(day):
+    """Advance the current and longest streaks for a gratitude added on day"""
+    last = st.session_state.gratitude_last_date
+    last = datetime.fromisoformat(last).date() if last else None
+    # Same day, or an earlier one after flying west: the streak doesn't move
+    if last is not None and day <= last:
+        return
+    if last is not None and (day - last).days == 1:
+        st.session_state.gratitude_streak += 1
+    else:
+        st.session_state.gratitude_streak = 1
+    st.session_state.gratitude_best_streak = max(st.session_state.gratitude_best_streak, st.session_state.gratitude_streak)
+    st.session_state.gratitude_last_date = day.isoformat()
+    save_session_value("gratitude_streak", "gratitude_best_streak", "gratitude_last_date")
+
+def current_gratitude_streak(today):
+    """The stored streak while it's still alive (last gratitude today or yesterday), else 0"""
+    last = st.session_state.gratitude_last_date
+    if not last or (today - datetime.fromisoformat(last).date()).days > 1:
+        return 0
+    return st.session_state.gratitude_streak
+
+def gratitude_heatmap_spec(today, weeks=GRATITUDE_HEATMAP_WEEKS):
+    """Vega-Lite calendar of gratitudes per day over the last weeks, read from the per-day index"""
+    end = today.toordinal()
+    first = int(monday_of(np.int64(end))) - 7 * (weeks - 1)
+    grid = np.zeros(end - first + 1, dtype=np.int64)
+    rows = get_session_store().metric_days(st.session_state.session_id, "gratitude", first)
+    if rows:
+        days, counts = np.array(rows, dtype=np.int64).T
+        inside = days <= end
+        np.add.at(grid, days[inside] - first, counts[inside])
+    values = [
+        {
+            "date": datetime.fromordinal(first + i).strftime("%b %d, %Y"),
+            "week": i // 7,
+            "day": WEEKDAY_NAMES[i % 7],
+            "count": int(count),
+        }
+        for i, count in enumerate(grid)
+    ]
+    return {
+        "data": {"values": values},
+        "mark": {"type": "rect", "cornerRadius": 2},
+        "encoding": {
+            "x": {"field": "week", "type": "ordinal", "axis": None},
+            "y": {"field": "day", "type": "ordinal", "sort": list(WEEKDAY_NAMES), "title": None},
+            "color": {"field": "count", "type": "quantitative", "scale": {"scheme": "purples"}, "legend": None},
+            "tooltip": [{"field": "date", "title": "Day"}, {"field": "count", "title": "Gratitudes"}],
+        },
+        "height": 140,
+    }
+
+def add_gratitude():
+    """Drop the typed gratitude into the jar and clear the input"""
+    gratitude_text = st.session_state.get("gratitude_input", "")
+    if not gratitude_text.strip():
+        flash("gratitude", "warning", "Write something to add!")
+        return
+    today = user_today()
+    st.session_state.gratitude_jar.append(GratitudeItem(gratitude_text.strip(), today.toordinal(), now_epoch()))
+    record_gratitude_day(today)
+    
+    st.session_state.gratitude_input = ""
+    flash("gratitude", "success", "Added to your jar! 🌟")
 
 def show_gratitude_jar():
     """Gratitude jar game"""
@@ -165,60 +1373,65 @@ def show_gratitude_jar():
     
     init_game_state()
     
-    today = datetime.now().date()
-    if st.session_state.gratitude_last_date:
-        last_date = datetime.fromisoformat(st.session_state.gratitude_last_date).date()
-        if last_date == today:
-            st.info(f"✨ You already added gratitude today! Streak: {st.session_state.gratitude_streak} days")
-        elif (today - last_date).days == 1:
-            pass
-        else:
-            st.session_state.gratitude_streak = 0
+    today = user_today()
+    streak = current_gratitude_streak(today)
+    if st.session_state.gratitude_last_date and datetime.fromisoformat(st.session_state.gratitude_last_date).date() >= today:
+        st.info(f"✨ You already added gratitude today! Streak: {streak} days")
     
     st.markdown("**What are you grateful for today?**")
     col1, col2 = st.columns([3, 1])
     
     with col1:
-        gratitude_text = st.text_input("", placeholder="I'm grateful for...", label_visibility="collapsed")
+        st.text_input("", placeholder="I'm grateful for...", label_visibility="collapsed", key="gratitude_input")
     with col2:
-        if st.button("Add ✨", use_container_width=True):
-            if gratitude_text.strip():
-                st.session_state.gratitude_jar.append({
-                    "text": gratitude_text.strip(),
-                    "date": today.isoformat()
-                })
-                
-                if not st.session_state.gratitude_last_date or datetime.fromisoformat(st.session_state.gratitude_last_date).date() != today:
-                    st.session_state.gratitude_streak += 1
-                    st.session_state.gratitude_last_date = datetime.now().isoformat()
-                
-                st.success("Added to your jar! 🌟")
-                time.sleep(1)
-                st.rerun()
-            else:
-                st.warning("Write something to add!")
+        st.button("Add ✨", use_container_width=True, on_click=add_gratitude)
+    show_flash("gratitude")
     
     st.markdown("---")
     
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     with col1:
         st.metric("Total Gratitudes", len(st.session_state.gratitude_jar))
     with col2:
-        st.metric("Current Streak", f"{st.session_state.gratitude_streak} days")
+        st.metric("Current Streak", f"{streak} days")
     with col3:
+        st.metric("Longest Streak", f"{st.session_state.gratitude_best_streak} days")
+    with col4:
         if st.button("🎲 Random Gratitude", use_container_width=True):
             if st.session_state.gratitude_jar:
+                # One keyed read: the jar knows its length and fetches a single entry by position
                 random_item = random.choice(st.session_state.gratitude_jar)
-                st.info(f"💭 Reminder: {random_item['text']}")
+                st.info(f"💭 Reminder: {random_item.text}")
     
     st.markdown("---")
     
     if st.session_state.gratitude_jar:
+        st.vega_lite_chart(gratitude_heatmap_spec(today), use_container_width=True)
         st.markdown("**Your Gratitudes:**")
         for i, item in enumerate(reversed(st.session_state.gratitude_jar[-10:])):
-            st.caption(f"✨ {item['text']}")
+            st.caption(f"✨ {item.text}")
 
 
+BREATHING_CYCLES = 3
+
+# The exercise animates in the browser; the server only hears back once it's done
+breathing_animation = components.declare_component(
+    "breathing", path=os.path.join(ASSET_SOURCE_DIR, "breathing")
+)
+
+def start_breathing_exercise(name, inhale, hold, exhale, purpose):
+    """Start a new client-side run; each run gets its own id so completions count once"""
+    st.session_state.breathing_runs_started = st.session_state.get("breathing_runs_started", 0) + 1
+    st.session_state.breathing_run = {
+        "run_id": st.session_state.breathing_runs_started,
+        "name": name,
+        "inhale": inhale,
+        "hold": hold,
+        "exhale": exhale,
+        "purpose": purpose,
+        "cycles": BREATHING_CYCLES,
+    }
+
 def show_breathing_exercise():
     """Guided breathing exercise"""
     st.markdown("### 🫁 Breathing Exercise")
@@ -229,16 +1442,18 @@ def show_breathing_exercise():
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        if st.button("4-7-8\n(Anxiety)", use_container_width=True, key="breath_478"):
-            run_breathing_exercise("4-7-8", 4, 7, 8, "Calm Anxiety")
+        st.button("4-7-8\n(Anxiety)", use_container_width=True, key="breath_478",
+                  on_click=start_breathing_exercise, args=("4-7-8", 4, 7, 8, "Calm Anxiety"))
     
     with col2:
-        if st.button("5-5-5\n(Relax)", use_container_width=True, key="breath_555"):
-            run_breathing_exercise("5-5-5", 5, 5, 5, "Deep Relaxation")
+        st.button("5-5-5\n(Relax)", use_container_width=True, key="breath_555",
+                  on_click=start_breathing_exercise, args=("5-5-5", 5, 5, 5, "Deep Relaxation"))
     
     with col3:
-        if st.button("Box\n(Focus)", use_container_width=True, key="breath_box"):
-            run_breathing_exercise("Box", 4, 4, 4, "Mental Focus")
+        st.button("Box\n(Focus)", use_container_width=True, key="breath_box",
+                  on_click=start_breathing_exercise, args=("Box", 4, 4, 4, "Mental Focus"))
+    
+    run_breathing_exercise()
     
     st.markdown("---")
     st.markdown("**Your Sessions:**")
@@ -247,60 +1462,26 @@ def show_breathing_exercise():
         st.caption(f"Total time: {st.session_state.breathing_total_time} seconds")
 
 
-def run_breathing_exercise(name, inhale, hold, exhale, purpose):
-    """Run the breathing exercise animation"""
-    st.markdown(f"## {name} Breathing - {purpose}")
-    
-    placeholder = st.empty()
-    
-    cycles = 3
-    
-    for cycle in range(cycles):
-        for i in range(inhale):
-            with placeholder.container():
-                st.markdown(f"""
-                <div style="text-align: center; padding: 3rem;">
-                    <div style="font-size: 4rem; margin: 2rem 0;">
-                        <span style="display: inline-block; width: {100 + (i/inhale)*100}px; height: {100 + (i/inhale)*100}px; border-radius: 50%; background: rgba(102, 126, 234, 0.3); border: 2px solid rgba(102, 126, 234, 0.8);"></span>
-                    </div>
-                    <h3 style="color: #fff;">INHALE... {i+1}/{inhale}</h3>
-                </div>
-                """, unsafe_allow_html=True)
-            time.sleep(1)
-        
-        for i in range(hold):
-            with placeholder.container():
-                st.markdown(f"""
-                <div style="text-align: center; padding: 3rem;">
-                    <div style="font-size: 4rem; margin: 2rem 0;">
-                        <span style="display: inline-block; width: 200px; height: 200px; border-radius: 50%; background: rgba(102, 126, 234, 0.5); border: 2px solid rgba(102, 126, 234, 0.8);"></span>
-                    </div>
-                    <h3 style="color: #fff;">HOLD... {i+1}/{hold}</h3>
-                </div>
-                """, unsafe_allow_html=True)
-            time.sleep(1)
-        
-        for i in range(exhale):
-            size = 200 - (i/exhale)*100
-            with placeholder.container():
-                st.markdown(f"""
-                <div style="text-align: center; padding: 3rem;">
-                    <div style="font-size: 4rem; margin: 2rem 0;">
-                        <span style="display: inline-block; width: {size}px; height: {size}px; border-radius: 50%; background: rgba(102, 126, 234, 0.2); border: 2px solid rgba(102, 126, 234, 0.6);"></span>
-                    </div>
-                    <h3 style="color: #fff;">EXHALE... {i+1}/{exhale}</h3>
-                </div>
-                """, unsafe_allow_html=True)
-            time.sleep(1)
-    
-    placeholder.empty()
-    st.success(f"✅ Great job! You completed {cycles} cycles of {name} breathing.")
-    
+def run_breathing_exercise():
+    """Show the active exercise and credit it once the browser reports it finished"""
+    run = st.session_state.get("breathing_run")
+    if run is None:
+        last = st.session_state.get("breathing_last_completed")
+        if last:
+            st.success(f"✅ Great job! You completed {last['cycles']} cycles of {last['name']} breathing.")
+        return
+
+    result = breathing_animation(**run, key=f"breathing_run_{run['run_id']}", default=None)
+    if not result or result.get("run_id") != run["run_id"]:
+        return
+
+    # Credit the prescribed duration rather than trusting a client-reported one
     st.session_state.breathing_sessions += 1
-    st.session_state.breathing_total_time += (cycles * (inhale + hold + exhale))
-    
-    time.sleep(2)
-    st.rerun()
+    st.session_state.breathing_total_time += run["cycles"] * (run["inhale"] + run["hold"] + run["exhale"])
+    save_session_value("breathing_sessions", "breathing_total_time")
+    st.session_state.breathing_last_completed = run
+    st.session_state.breathing_run = None
+    rerun_fragment()
 
 
 # ============ MAIN APP FUNCTIONS ============
@@ -323,9 +1504,116 @@ CRISIS_RESPONSE = (
     "hotline or text line for immediate support."
 )
 
+_NON_WORD = re.compile(r"[\W_]+")
+
+def normalize_text(text):
+    """Unicode case-fold and collapse runs of whitespace/punctuation to one space"""
+    folded = unicodedata.normalize("NFKC", text).casefold()
+    return _NON_WORD.sub(" ", folded).strip()
+
+class PhraseMatcher:
+    """Aho-Corasick automaton: finds every phrase in a single pass over the text"""
+
+    def __init__(self, phrases):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for phrase in phrases:
+            normalized = normalize_text(phrase)
+            if not normalized:
+                continue
+            state = 0
+            for char in normalized:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            self._out[state] += (phrase,)
+
+        # Breadth-first pass to wire failure links and merge outputs
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """Original phrases found in the normalized text, in order of first match"""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = {}
+        state = 0
+        for char in normalize_text(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for phrase in out[state]:
+                found.setdefault(phrase, None)
+        return list(found)
+
+@st.cache_resource(show_spinner=False)
+def get_crisis_matcher():
+    """Built once per process; no arguments, so a cached lookup never hashes the phrase list"""
+    return PhraseMatcher(CRISIS_KEYWORDS)
+
+def find_crisis_phrases(text):
+    return get_crisis_matcher().find(text)
+
 def is_possible_crisis(text:str) -> bool:
-    lowered = text.lower()
-    return any(phrase in lowered for phrase in CRISIS_KEYWORDS)
+    return bool(find_crisis_phrases(text))
+
+# Messages rendered in the chat tab before "Load earlier"
+CHAT_WINDOW_SIZE = int(os.getenv("CHAT_WINDOW_SIZE", "50"))
+
+def widen_chat_window():
+    st.session_state.chat_window += CHAT_WINDOW_SIZE
+
+# Token budget for the history sent with each chat turn
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+TOKENS_PER_MESSAGE = 4
+
+def estimate_tokens(text):
+    """Local token estimate (~4 characters per token), no network or tokenizer needed"""
+    return (len(text) + 3) // 4
+
+def build_context_window(system_prompt, conversation_messages, budget=CONTEXT_TOKEN_BUDGET, summary=""):
+    """Keep the system prompt, any running summary and the newest turns that fit in the budget.
+
+    Returns the messages to send plus stats on what was trimmed.
+    """
+    preamble = [{"role": "system", "content": system_prompt}]
+    if summary:
+        preamble.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+
+    costs = [estimate_tokens(m.content) + TOKENS_PER_MESSAGE for m in conversation_messages]
+    used = sum(estimate_tokens(m["content"]) + TOKENS_PER_MESSAGE for m in preamble)
+    total = used + sum(costs)
+
+    # Walk back from the newest turn; the newest always goes out, even if over budget
+    start = len(conversation_messages)
+    while start > 0 and (start == len(conversation_messages) or used + costs[start - 1] <= budget):
+        start -= 1
+        used += costs[start]
+
+    # Don't open the window on a dangling assistant reply
+    while start < len(conversation_messages) - 1 and conversation_messages[start].role != "user":
+        used -= costs[start]
+        start += 1
+
+    kept = [{"role": m.role, "content": m.content} for m in conversation_messages[start:]]
+    return preamble + kept, {
+        "budget": budget,
+        "tokens_sent": used,
+        "tokens_trimmed": total - used,
+        "messages_dropped": start,
+    }
 
 def generate_assistant_reply(conversation_messages):
     if DEMO_MODE or not client:
@@ -338,20 +1626,31 @@ def generate_assistant_reply(conversation_messages):
         cultural_prompt = f"\nAlso consider this user's perspective: {context_info['reflection_style']}"
         adjusted_prompt = SYSTEM_PROMPT + cultural_prompt
         
+        summary = st.session_state.get("conversation_summary") or {"text": "", "folded": 0}
+        # No message costs less than TOKENS_PER_MESSAGE, so older ones could never fit. They
+        # aren't read back to be measured, so they're counted apart from tokens_trimmed
+        start = max(summary["folded"], len(conversation_messages) - CONTEXT_TOKEN_BUDGET // TOKENS_PER_MESSAGE)
+        api_messages, context_stats = build_context_window(
+            adjusted_prompt, conversation_messages[start:], summary=summary["text"]
+        )
+        context_stats["messages_skipped"] = start - summary["folded"]
+        st.session_state.context_stats = context_stats
+
         if st.session_state.get("show_debug"):
             st.info(f"🔍 **Debug**: Using cultural prompt: '{context_info['reflection_style']}'")
-        
-        api_messages = [{"role": "system", "content": adjusted_prompt}] + conversation_messages
+            st.info(f"🔍 **Debug**: Sent ~{context_stats['tokens_sent']} tokens, trimmed ~{context_stats['tokens_trimmed']} ({context_stats['messages_dropped']} older messages, {context_stats['messages_skipped']} more not measured)")
 
-        stream = client.chat.completions.create(
-            model=st.session_state["openai_model"],
-            messages=api_messages,
-            stream=True,
+        chunks = queue.SimpleQueue()
+        future = get_openai_runner().submit(
+            st.session_state.session_id, "reply",
+            stream_completion(st.session_state["openai_model"], api_messages, chunks),
         )
-
-        response_text = st.write_stream(stream)
+        response_text = st.write_stream(iter_stream(future, chunks))
         return response_text
     
+    except CancelledError:
+        # Superseded by a newer message from this session
+        return None
     except openai.RateLimitError:
         st.error("We've hit the OpenAI usage limit for now. Please wait a bit or check your billing/usage")
     except Exception as e:
@@ -360,20 +1659,148 @@ def generate_assistant_reply(conversation_messages):
     
     return None
 
-def generate_journal_prompts(emotion_log):
-    if DEMO_MODE or not client:
-        return "📝 Journal prompts require API key. Add OPENAI_API_KEY to .env file."
-    
-    recent_entries = emotion_log[-5:]
+# Rolling summary: "truncate" only trims, "summarize" also folds old turns into a summary
+CONTEXT_MODE = os.getenv("CONTEXT_MODE", "truncate")
+SUMMARY_THRESHOLD_MESSAGES = int(os.getenv("SUMMARY_THRESHOLD_MESSAGES", "24"))
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "8"))
+# A failed summary waits this long before the next try, doubling per failure up to the max
+SUMMARY_RETRY_SECONDS = 30
+SUMMARY_RETRY_MAX_SECONDS = 600
+
+async def summarize_delta(previous_summary, new_messages, model):
+    """Fold new turns into the previous summary; only the delta is sent"""
+    transcript = "\n".join(f"{m.role.title()}: {m.content}" for m in new_messages)
+    prompt_text = (
+        "Update the running summary of a supportive conversation. Keep it under "
+        "150 words, in the third person, and keep the feelings, situations and "
+        "concerns the user has shared.\n\n"
+        f"Current summary:\n{previous_summary or '(none yet)'}\n\n"
+        f"New turns:\n{transcript}"
+    )
+    resp = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": "You write short, faithful summaries of conversations."},
+            {"role": "user", "content": prompt_text},
+        ],
+    )
+    return resp.choices[0].message.content
+
+def collect_conversation_summary():
+    """Apply a summary that finished since the last run; True while one is still being written"""
+    job = st.session_state.get("summary_job")
+    if job is None:
+        return False
+    if not job["future"].done():
+        return True
+    del st.session_state.summary_job
+    if job["future"].cancelled():
+        return False
+
+    error = job["future"].exception()
+    text = None if error else job["future"].result()
+    if not text:
+        failures = st.session_state.get("summary_failures", 0) + 1
+        delay = min(SUMMARY_RETRY_SECONDS * 2 ** (failures - 1), SUMMARY_RETRY_MAX_SECONDS)
+        st.session_state.summary_failures = failures
+        st.session_state.summary_retry_at = time.monotonic() + delay
+        logger.warning("Conversation summary failed (%d in a row); retrying in %ds", failures, delay,
+                       exc_info=error or None)
+        return False
+
+    st.session_state.summary_failures = 0
+    summary = st.session_state.conversation_summary
+    # Skip it if the history it was folded from has since been reset
+    if summary["folded"] == job["folded"] and len(st.session_state.messages) >= job["fold_to"]:
+        st.session_state.conversation_summary = {"text": text, "folded": job["fold_to"]}
+        save_session_value("conversation_summary")
+    return False
+
+def update_conversation_summary(messages):
+    """Fold older turns into the session's summary once the unsummarized history passes the threshold.
+
+    The summary is written on the OpenAI loop without holding up the script;
+    collect_conversation_summary applies it on a later run.
+    """
+    if CONTEXT_MODE != "summarize" or DEMO_MODE or not client:
+        return
+    if collect_conversation_summary() or time.monotonic() < st.session_state.get("summary_retry_at", 0):
+        return
+
+    summary = st.session_state.conversation_summary
+    if len(messages) - summary["folded"] <= SUMMARY_THRESHOLD_MESSAGES:
+        return
+
+    # Keep the recent window starting on a user turn
+    fold_to = len(messages) - SUMMARY_KEEP_RECENT
+    while fold_to < len(messages) and messages[fold_to].role != "user":
+        fold_to += 1
+
+    future = get_openai_runner().submit(st.session_state.session_id, "summary", summarize_delta(
+        summary["text"], messages[summary["folded"]:fold_to],
+        st.session_state.get("openai_model", DEFAULT_MODEL),
+    ))
+    st.session_state.summary_job = {"future": future, "folded": summary["folded"], "fold_to": fold_to}
+
+# Journal prompts are cached by content, so reruns don't re-call the model
+JOURNAL_PROMPT_CACHE_SIZE = int(os.getenv("JOURNAL_PROMPT_CACHE_SIZE", "512"))
+JOURNAL_PROMPT_CACHE_TTL = float(os.getenv("JOURNAL_PROMPT_CACHE_TTL", "3600"))
+
+class PromptCache:
+    """Thread-safe LRU cache whose entries expire after a TTL"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and item[1] < time.monotonic():
+                del self._entries[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+@st.cache_resource(show_spinner=False)
+def get_prompt_cache():
+    return PromptCache(JOURNAL_PROMPT_CACHE_SIZE, JOURNAL_PROMPT_CACHE_TTL)
+
+def journal_prompt_key(emotion_log, cultural_context, model, summary=""):
+    """Digest of the last five check-ins plus everything else the prompt depends on"""
+    recent = [[entry.user_text, entry.assistant_text] for entry in emotion_log[-5:]]
+    payload = json.dumps([recent, cultural_context, model, summary], ensure_ascii=False)
+    return hashlib.md5(payload.encode()).hexdigest()
+
+async def request_journal_prompts(recent_entries, cultural_context, model, summary=""):
+    """Call the model for journal prompts; runs on the OpenAI loop"""
     context_lines = []
     for entry in recent_entries:
-        context_lines.append(f"User: {entry['user_text']}")
-        context_lines.append(f"DMSpace: {entry['assistant_text']}")
+        context_lines.append(f"User: {entry.user_text}")
+        context_lines.append(f"DMSpace: {entry.assistant_text}")
         context_lines.append("")
 
     context_text = "\n".join(context_lines)
     
-    cultural_context = st.session_state.get("cultural_context", "balanced")
     context_info = CULTURAL_CONTEXTS.get(cultural_context, CULTURAL_CONTEXTS["balanced"])
 
     prompt_text = (
@@ -383,6 +1810,10 @@ def generate_journal_prompts(emotion_log):
         "generate 3 short, simple journaling prompts that feel warm and human.\n\n"
         f"The user values: {', '.join(context_info['values'])}\n"
         f"Perspective: {context_info['reflection_style']}\n\n"
+    )
+    if summary:
+        prompt_text += f"Summary of their earlier conversation: {summary}\n\n"
+    prompt_text += (
         "Here are some recent check-ins:\n"
         f"{context_text}\n\n"
         "First, in 1–2 short sentences, summarize the overall themes you're noticing. "
@@ -390,8 +1821,8 @@ def generate_journal_prompts(emotion_log):
     )
 
     try:
-        resp = client.chat.completions.create(
-            model=st.session_state.get("openai_model", DEFAULT_MODEL),
+        resp = await client.chat.completions.create(
+            model=model,
             messages=[
                 {"role": "system", "content": "You create gentle, supportive journaling prompts that respect diverse cultural perspectives."},
                 {"role": "user", "content": prompt_text},
@@ -401,65 +1832,237 @@ def generate_journal_prompts(emotion_log):
     except Exception:
         return None
 
+# Journal prompts are generated off the script thread after each chat turn
+JOURNAL_PREFETCH_MAX_IN_FLIGHT = int(os.getenv("JOURNAL_PREFETCH_MAX_IN_FLIGHT", "8"))
+JOURNAL_PREFETCH_RETRY_SECONDS = 30
+JOURNAL_PREFETCH_POLL_SECONDS = 2
+
+class JournalPromptPrefetcher:
+    """Journal prompts generated on the OpenAI loop; a session's newer job supersedes its older one"""
+
+    def __init__(self, cache, runner, max_in_flight):
+        self.cache = cache
+        self._runner = runner
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._jobs = {}
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session_id, key, fn, *args):
+        """Schedule fn(*args) to fill cache[key]; returns True while a job for key is pending"""
+        with self._lock:
+            job = self._jobs.get(session_id)
+            if job and not job[1].done():
+                if job[0] == key:
+                    return True
+                # Its check-ins are stale: cancel it, mid-request if need be
+                self._runner.cancel(session_id, "journal_prompts")
+            if time.monotonic() - self._failed.get(key, float("-inf")) < JOURNAL_PREFETCH_RETRY_SECONDS:
+                return False
+            if not self._slots.acquire(blocking=False):
+                # Pool is saturated; the next render will try again
+                self._jobs.pop(session_id, None)
+                return False
+            future = self._runner.submit(session_id, "journal_prompts", self._run(key, fn, *args))
+            future.add_done_callback(lambda _: self._slots.release())
+            self._jobs[session_id] = (key, future)
+            return True
+
+    async def _run(self, key, fn, *args):
+        result = await fn(*args)
+        if result:
+            self.cache.put(key, result)
+        else:
+            with self._lock:
+                now = time.monotonic()
+                self._failed = {k: t for k, t in self._failed.items() if now - t < JOURNAL_PREFETCH_RETRY_SECONDS}
+                self._failed[key] = now
+        return result
+
+    def is_pending(self, session_id):
+        with self._lock:
+            job = self._jobs.get(session_id)
+            return bool(job and not job[1].done())
+
+    def in_flight(self):
+        with self._lock:
+            return sum(1 for _, future in self._jobs.values() if not future.done())
+
+@st.cache_resource(show_spinner=False)
+def get_journal_prefetcher():
+    return JournalPromptPrefetcher(get_prompt_cache(), get_openai_runner(), JOURNAL_PREFETCH_MAX_IN_FLIGHT)
+
+def generate_journal_prompts(emotion_log):
+    """Cached prompts for the recent check-ins, or None while they're generated in the background"""
+    if DEMO_MODE or not client:
+        return "📝 Journal prompts require API key. Add OPENAI_API_KEY to .env file."
+    
+    cultural_context = st.session_state.get("cultural_context", "balanced")
+    model = st.session_state.get("openai_model", DEFAULT_MODEL)
+    summary = st.session_state.conversation_summary["text"]
+    key = journal_prompt_key(emotion_log, cultural_context, model, summary)
+
+    prompts = get_prompt_cache().get(key)
+    if prompts is None:
+        get_journal_prefetcher().submit(
+            st.session_state.session_id, key,
+            request_journal_prompts, list(emotion_log[-5:]), cultural_context, model, summary,
+        )
+    return prompts
+
+def show_journal_prompts(polling=False):
+    """Render the latest prompts, falling back to the previous ones while new ones load.
+
+    While polling, the first run that finds the job settled reruns the app:
+    run_every only changes when the journal tab registers this fragment
+    again, so otherwise the poll would outlive the job.
+    """
+    prompts = generate_journal_prompts(st.session_state.emotion_log)
+    pending = get_journal_prefetcher().is_pending(st.session_state.session_id)
+    if polling and not pending:
+        st.rerun()
+    if prompts:
+        st.session_state.last_journal_prompts = prompts
+        st.markdown(prompts)
+        return
+
+    previous = st.session_state.get("last_journal_prompts")
+    if previous:
+        st.markdown(previous)
+    if pending:
+        st.caption("✨ Writing new prompts for you...")
+    elif not previous:
+        st.caption("Prompts aren't available right now. Try again in a moment.")
+
 def init_peer_state():
-    if "peers" not in st.session_state:
-        st.session_state.peers = {}
-    if "peer_chats" not in st.session_state:
-        st.session_state.peer_chats = {}
+    if "peer_chat_views" not in st.session_state:
+        st.session_state.peer_chat_views = {}
     if "my_user_id" not in st.session_state:
-        st.session_state.my_user_id = hashlib.md5(
-            str(datetime.now().timestamp()).encode()
-        ).hexdigest()[:6]
+        st.session_state.my_user_id = secrets.token_hex(8)
+        save_session_value("my_user_id")
     if "cultural_context" not in st.session_state:
         st.session_state.cultural_context = "balanced"
     if "show_debug" not in st.session_state:
         st.session_state.show_debug = False
 
-def extract_themes(messages):
-    themes = {
-        "anxiety": 0, "depression": 0, "relationships": 0,
-        "work_school": 0, "identity": 0, "family": 0,
-    }
-    
-    keywords = {
-        "anxiety": ["anxious", "worried", "nervous", "panic", "stress", "overwhelm"],
-        "depression": ["sad", "depressed", "hopeless", "down", "empty", "lonely"],
-        "relationships": ["friend", "partner", "love", "breakup", "dating", "conflict"],
-        "work_school": ["work", "school", "job", "deadline", "exam", "pressure"],
-        "identity": ["identity", "culture", "belong", "different", "acceptance"],
-        "family": ["parent", "family", "sibling", "home", "support"],
-    }
-    
-    user_text = " ".join([m["content"] for m in messages if m["role"] == "user"]).lower()
-    
-    for theme, words in keywords.items():
-        themes[theme] = sum(user_text.count(word) for word in words)
-    
-    return {k: v for k, v in themes.items() if v > 0}
+THEME_KEYWORDS = {
+    "anxiety": ["anxious", "worried", "nervous", "panic", "stress", "overwhelm"],
+    "depression": ["sad", "depressed", "hopeless", "down", "empty", "lonely"],
+    "relationships": ["friend", "partner", "love", "breakup", "dating", "conflict"],
+    "work_school": ["work", "school", "job", "deadline", "exam", "pressure"],
+    "identity": ["identity", "culture", "belong", "different", "acceptance"],
+    "family": ["parent", "family", "sibling", "home", "support"],
+}
+
+THEME_BY_WORD = {word: theme for theme, words in THEME_KEYWORDS.items() for word in words}
+
+# Inflections that still count as the keyword ("friends", "stressed", "belonging")
+THEME_SUFFIXES = ("s", "es", "ed", "d", "ing", "ful")
 
-def create_profile(user_id, messages):
-    if len(messages) < 2:
+# Set DMSPACE_VERIFY_THEMES=1 to check incremental counters against a full recompute
+VERIFY_THEMES = os.getenv("DMSPACE_VERIFY_THEMES") == "1"
+
+def theme_for_token(token):
+    theme = THEME_BY_WORD.get(token)
+    if theme:
+        return theme
+    for suffix in THEME_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            theme = THEME_BY_WORD.get(token[:-len(suffix)])
+            if theme:
+                return theme
+    return None
+
+def count_themes(text, counts):
+    """Add theme hits from one message to counts, in a single tokenized pass"""
+    for token in normalize_text(text).split():
+        theme = theme_for_token(token)
+        if theme:
+            counts[theme] += 1
+    return counts
+
+def new_theme_stats():
+    return {"counts": dict.fromkeys(THEME_KEYWORDS, 0), "user_messages": 0, "messages": 0}
+
+def record_theme_stats(stats, message):
+    """Fold one newly appended message into the running stats"""
+    stats["messages"] += 1
+    if message.role == "user":
+        stats["user_messages"] += 1
+        count_themes(message.content, stats["counts"])
+    return stats
+
+def compute_theme_stats(messages):
+    """Full recompute over the history; the reference for the incremental path"""
+    stats = new_theme_stats()
+    for message in messages:
+        record_theme_stats(stats, message)
+    return stats
+
+def extract_themes(messages):
+    counts = compute_theme_stats(messages)["counts"]
+    return {k: v for k, v in counts.items() if v > 0}
+
+def add_chat_message(role, content):
+    """Append to the chat history and update the session's theme counters"""
+    message = ChatMessage(role, content, now_epoch())
+    st.session_state.messages.append(message)
+    record_theme_stats(st.session_state.theme_stats, message)
+
+    if VERIFY_THEMES:
+        expected = compute_theme_stats(st.session_state.messages)
+        if expected != st.session_state.theme_stats:
+            st.warning("🔍 Theme counters drifted from a full recompute; resyncing.")
+            st.session_state.theme_stats = expected
+    save_session_value("theme_stats")
+
+PROFILE_STAGES = ("🌱 Just Starting", "🔍 Exploring", "✨ Reflecting")
+
+def set_peer_opt_in(opt_in):
+    """Opt this session's profile in or out; remembered so a rebuilt profile keeps it"""
+    st.session_state.peer_opt_in = opt_in
+    get_peer_registry().set_opt_in(st.session_state.my_user_id, opt_in)
+
+def publish_profile():
+    """Put this session's current profile in the peer registry, keeping its opt-in"""
+    profile = create_profile(st.session_state.my_user_id, stats=st.session_state.theme_stats)
+    if profile:
+        profile["opt_in"] = st.session_state.get("peer_opt_in", False)
+        get_peer_registry().put(profile)
+
+def create_profile(user_id, messages=None, stats=None):
+    if stats is None:
+        stats = compute_theme_stats(messages)
+
+    if stats["messages"] < 2:
         return None
     
-    themes = extract_themes(messages)
+    themes = {k: v for k, v in stats["counts"].items() if v > 0}
     if not themes:
         return None
     
-    num_messages = len([m for m in messages if m["role"] == "user"])
+    num_messages = stats["user_messages"]
     if num_messages < 5:
-        stage = "🌱 Just Starting"
+        stage = PROFILE_STAGES[0]
     elif num_messages < 15:
-        stage = "🔍 Exploring"
+        stage = PROFILE_STAGES[1]
     else:
-        stage = "✨ Reflecting"
+        stage = PROFILE_STAGES[2]
     
     return {
         "user_id": user_id,
         "top_themes": sorted(themes.items(), key=lambda x: x[1], reverse=True)[:2],
         "stage": stage,
         "opt_in": False,
+        "active_at": now_epoch(),
     }
 
+# Match score = theme overlap (Jaccard) * THEME_WEIGHT + a stage bonus
+THEME_WEIGHT = 50
+SAME_STAGE_BONUS = 50
+OTHER_STAGE_BONUS = 25
+MATCH_LIMIT = 3
+
 def match_score(profile1, profile2):
     if not profile1 or not profile2:
         return 0
@@ -468,45 +2071,536 @@ def match_score(profile1, profile2):
     themes2 = set(t[0] for t in profile2.get("top_themes", []))
     
     theme_overlap = len(themes1 & themes2) / max(len(themes1 | themes2), 1)
-    score = theme_overlap * 50
+    score = theme_overlap * THEME_WEIGHT
     
     if profile1["stage"] == profile2["stage"]:
-        score += 50
+        score += SAME_STAGE_BONUS
     else:
-        score += 25
+        score += OTHER_STAGE_BONUS
     
     return int(score)
 
-def find_matches(my_id, min_score=40):
-    my_profile = st.session_state.peers.get(my_id)
-    
-    if not my_profile or not my_profile.get("opt_in"):
-        return []
-    
-    matches = []
-    for user_id, profile in st.session_state.peers.items():
-        if user_id == my_id or not profile.get("opt_in"):
-            continue
-        
-        score = match_score(my_profile, profile)
-        if score >= min_score:
-            matches.append((user_id, score))
-    
-    return sorted(matches, key=lambda x: x[1], reverse=True)
+# Peers are shared by every session in the process; set DMSPACE_PEER_DB to
+# share them, and their chat rooms, across worker processes on one host through SQLite
+PEER_DB_PATH = os.getenv("DMSPACE_PEER_DB")
+PEER_REGISTRY_STRIPES = 16
+PEER_SYNC_SECONDS = 2.0
+# Profiles not refreshed for this long are dropped, e.g. ones a crashed process left in DMSPACE_PEER_DB
+PEER_PROFILE_TTL_SECONDS = float(os.getenv("DMSPACE_PEER_TTL", "86400"))
+PEER_EXPIRE_SECONDS = 60.0
+
+class PeerRegistry:
+    """Thread-safe peer profiles, with opted-in users indexed by theme and by stage.
+
+    Profiles live in lock-striped shards and every index bucket has its own
+    lock, so concurrent opt-ins only contend when they touch the same shard
+    or bucket. A shard lock may be held while taking a bucket lock, never the
+    other way round. Profiles are replaced through put() rather than mutated
+    in place, so the indexes always match what's stored.
+    """
+
+    def __init__(self, db_path=None):
+        self._shards = [({}, threading.Lock()) for _ in range(PEER_REGISTRY_STRIPES)]
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._db = PeerStore(db_path) if db_path else None
+        self._synced_version = 0
+        self._synced_at = 0.0
+        self._sync_lock = threading.Lock()
+        self._expired_at = 0.0
+        if self._db:
+            self.sync(force=True)
+
+    def _shard(self, user_id):
+        return self._shards[hash(user_id) % PEER_REGISTRY_STRIPES]
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._buckets_lock:
+                bucket = self._buckets.setdefault(key, (set(), threading.Lock()))
+        return bucket
+
+    def _bucket_keys(self, profile):
+        if not profile or not profile.get("opt_in"):
+            return set()
+        keys = {("opted_in",), ("stage", profile["stage"])}
+        keys.update(("theme", theme) for theme, _ in profile.get("top_themes", []))
+        return keys
+
+    def _reindex(self, user_id, old, new):
+        old_keys, new_keys = self._bucket_keys(old), self._bucket_keys(new)
+        for key in old_keys - new_keys:
+            members, lock = self._bucket(key)
+            with lock:
+                members.discard(user_id)
+        for key in new_keys - old_keys:
+            members, lock = self._bucket(key)
+            with lock:
+                members.add(user_id)
+
+    def _members(self, key):
+        members, lock = self._bucket(key)
+        with lock:
+            return set(members)
+
+    def _apply(self, user_id, profile):
+        profiles, lock = self._shard(user_id)
+        with lock:
+            old = profiles.pop(user_id, None)
+            if profile is not None:
+                profiles[user_id] = profile
+            self._reindex(user_id, old, profile)
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __len__(self):
+        return sum(len(profiles) for profiles, _ in self._shards)
+
+    def __iter__(self):
+        user_ids = []
+        for profiles, lock in self._shards:
+            with lock:
+                user_ids.extend(profiles)
+        return iter(user_ids)
+
+    def get(self, user_id, default=None):
+        profiles, lock = self._shard(user_id)
+        with lock:
+            return profiles.get(user_id, default)
+
+    def put(self, profile):
+        self._apply(profile["user_id"], profile)
+        if self._db:
+            self._db.save(profile["user_id"], profile)
+
+    def set_opt_in(self, user_id, opt_in):
+        profiles, lock = self._shard(user_id)
+        with lock:
+            old = profiles.get(user_id)
+            if old is None:
+                return
+            profile = {**old, "opt_in": opt_in}
+            profiles[user_id] = profile
+            self._reindex(user_id, old, profile)
+        if self._db:
+            self._db.save(user_id, profile)
+
+    def remove(self, user_id):
+        self._apply(user_id, None)
+        if self._db:
+            self._db.save(user_id, None)
+
+    def sync(self, force=False):
+        """Pull profile changes written by other processes since the last sync"""
+        if not self._db:
+            return
+        with self._sync_lock:
+            if not force and time.monotonic() - self._synced_at < PEER_SYNC_SECONDS:
+                return
+            for user_id, profile, version in self._db.changes_since(self._synced_version):
+                self._apply(user_id, profile)
+                self._synced_version = max(self._synced_version, version)
+            self._synced_at = time.monotonic()
+
+    def expire(self, max_age=PEER_PROFILE_TTL_SECONDS, force=False):
+        """Remove profiles not refreshed within max_age, at most once per PEER_EXPIRE_SECONDS"""
+        with self._sync_lock:
+            if not force and time.monotonic() - self._expired_at < PEER_EXPIRE_SECONDS:
+                return 0
+            self._expired_at = time.monotonic()
+        cutoff = now_epoch() - max_age
+        stale = []
+        for profiles, lock in self._shards:
+            with lock:
+                stale.extend(user_id for user_id, profile in profiles.items() if profile.get("active_at", 0) < cutoff)
+        for user_id in stale:
+            self.remove(user_id)
+        return len(stale)
+
+    def candidates(self, profile, min_score):
+        """Opted-in users who could reach min_score against profile"""
+        # Sharing neither a theme nor the stage scores exactly OTHER_STAGE_BONUS
+        if min_score <= OTHER_STAGE_BONUS:
+            return self._members(("opted_in",))
+        found = self._members(("stage", profile["stage"]))
+        for theme, _ in profile.get("top_themes", []):
+            found |= self._members(("theme", theme))
+        return found
+
+    def top_matches(self, user_id, k=None, min_score=40):
+        """Best (user_id, score) pairs for user_id, highest first"""
+        self.sync()
+        self.expire()
+        me = self.get(user_id)
+        if not me or not me.get("opt_in"):
+            return []
+
+        scored = []
+        for other_id in self.candidates(me, min_score):
+            other = self.get(other_id)
+            if other_id == user_id or not other or not other.get("opt_in"):
+                continue
+            score = match_score(me, other)
+            if score >= min_score:
+                scored.append((score, other_id))
+
+        if k is None:
+            best = sorted(scored, reverse=True)
+        else:
+            best = heapq.nlargest(k, scored)
+        return [(other_id, score) for score, other_id in best]
+
+class PeerStore:
+    """SQLite (WAL) backing for PeerRegistry; removals are kept as tombstones"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS peers ("
+                " user_id TEXT PRIMARY KEY, profile TEXT, version INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS peers_version ON peers(version)")
+
+    def save(self, user_id, profile):
+        payload = json.dumps(profile, ensure_ascii=False) if profile is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO peers (user_id, profile, version)"
+                " VALUES (?, ?, (SELECT COALESCE(MAX(version), 0) + 1 FROM peers))"
+                " ON CONFLICT(user_id) DO UPDATE SET profile = excluded.profile, version = excluded.version",
+                (user_id, payload),
+            )
+
+    def changes_since(self, version):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, profile, version FROM peers WHERE version > ? ORDER BY version", (version,)
+            ).fetchall()
+        return [
+            (user_id, json.loads(payload) if payload is not None else None, row_version)
+            for user_id, payload, row_version in rows
+        ]
+
+@st.cache_resource(show_spinner=False)
+def get_peer_registry():
+    return PeerRegistry(PEER_DB_PATH)
+
+# Batch scoring: themes packed as bitmasks, stages as small ints
+THEME_BITS = {theme: 1 << i for i, theme in enumerate(THEME_KEYWORDS)}
+STAGE_CODES = {stage: i for i, stage in enumerate(PROFILE_STAGES)}
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def theme_mask(profile):
+    mask = 0
+    for theme, _ in profile.get("top_themes", []):
+        mask |= THEME_BITS[theme]
+    return mask
+
+def batch_scores(masks, stages, query_mask, query_stage):
+    """match_score of one (mask, stage) against whole arrays, vectorized"""
+    inter = POPCOUNT[masks & query_mask]
+    union = POPCOUNT[masks | query_mask]
+    overlap = inter / np.maximum(union, 1)
+    bonus = np.where(stages == query_stage, SAME_STAGE_BONUS, OTHER_STAGE_BONUS)
+    return (overlap * THEME_WEIGHT + bonus).astype(np.int64)
+
+def pairwise_scores(masks, stages, block_elements=4_000_000):
+    """All-pairs scores for offline analysis, yielded as (first_row, uint8 block)"""
+    rows = max(1, block_elements // max(len(masks), 1))
+    for start in range(0, len(masks), rows):
+        block_masks = masks[start:start + rows, None]
+        inter = POPCOUNT[block_masks & masks[None, :]]
+        union = POPCOUNT[block_masks | masks[None, :]]
+        overlap = inter / np.maximum(union, 1)
+        bonus = np.where(stages[start:start + rows, None] == stages[None, :], SAME_STAGE_BONUS, OTHER_STAGE_BONUS)
+        yield start, (overlap * THEME_WEIGHT + bonus).astype(np.uint8)
+
+class ProfileBatch:
+    """Peer profiles packed into NumPy arrays; match_score stays the reference"""
+
+    def __init__(self, profiles):
+        self.user_ids = [p["user_id"] for p in profiles]
+        self.masks = np.fromiter((theme_mask(p) for p in profiles), dtype=np.uint8, count=len(profiles))
+        self.stages = np.fromiter((STAGE_CODES[p["stage"]] for p in profiles), dtype=np.int8, count=len(profiles))
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def scores(self, profile):
+        return batch_scores(self.masks, self.stages, theme_mask(profile), STAGE_CODES[profile["stage"]])
+
+    def top_matches(self, profile, k=MATCH_LIMIT, min_score=40):
+        scores = self.scores(profile)
+        eligible = np.flatnonzero(scores >= min_score)
+        eligible = eligible[[self.user_ids[i] != profile["user_id"] for i in eligible]]
+        if len(eligible) > k:
+            eligible = eligible[np.argpartition(-scores[eligible], k - 1)[:k]]
+        best = eligible[np.argsort(-scores[eligible], kind="stable")]
+        return [(self.user_ids[i], int(scores[i])) for i in best]
+
+def random_profiles(n, seed=0):
+    rng = random.Random(seed)
+    themes = list(THEME_KEYWORDS)
+    return [
+        {
+            "user_id": f"peer{i}",
+            "top_themes": [(t, 1) for t in rng.sample(themes, rng.randint(1, 2))],
+            "stage": rng.choice(PROFILE_STAGES),
+            "opt_in": True,
+        }
+        for i in range(n)
+    ]
+
+def find_matches(my_id, min_score=40, k=None):
+    return get_peer_registry().top_matches(my_id, k=k, min_score=min_score)
+
+PEER_CHAT_PAGE_SIZE = 20
+PEER_CHAT_POLL_SECONDS = 2
+PEER_CHAT_QUEUE_SIZE = 64
+
+class ChatBroker:
+    """In-process pub/sub: each subscriber gets a bounded queue of new seqs per room.
+
+    A full queue drops its oldest entries; that's safe because readers fetch
+    everything after their own last-seen cursor, the queue only says when.
+    """
+
+    def __init__(self, queue_size=PEER_CHAT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._queues = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def subscribe(self, subscriber_id, chat_id):
+        with self._lock:
+            self._queues[chat_id].setdefault(subscriber_id, deque(maxlen=self.queue_size))
+
+    def unsubscribe(self, subscriber_id):
+        """Drop every queue of subscriber_id, and rooms left with no subscribers"""
+        with self._lock:
+            for chat_id, subscribers in list(self._queues.items()):
+                subscribers.pop(subscriber_id, None)
+                if not subscribers:
+                    del self._queues[chat_id]
+
+    def close(self, chat_id):
+        with self._lock:
+            self._queues.pop(chat_id, None)
+
+    def publish(self, chat_id, seq):
+        with self._lock:
+            for pending in self._queues.get(chat_id, {}).values():
+                pending.append(seq)
+
+    def drain(self, subscriber_id, chat_id):
+        """New seqs since the last drain (empty if nothing arrived)"""
+        with self._lock:
+            pending = self._queues.get(chat_id, {}).get(subscriber_id)
+            if not pending:
+                return []
+            seqs = list(pending)
+            pending.clear()
+            return seqs
+
+class PeerChatStore:
+    """Peer chat rooms indexed by participant pair, each with an append-only log.
+
+    A message's seq is its position in the room's log, so cursors stay valid
+    as new messages arrive.
+    """
+
+    def __init__(self, broker=None):
+        self.broker = broker or ChatBroker()
+        self._rooms = {}
+        self._by_pair = {}
+        self._by_user = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def open_room(self, user1, user2):
+        """Room for the pair, created on first use"""
+        pair = tuple(sorted([user1, user2]))
+        with self._lock:
+            chat_id = self._by_pair.get(pair)
+            if chat_id is None:
+                # Random rather than derived from the pair, and never reused while the room exists
+                chat_id = secrets.token_hex(8)
+                while chat_id in self._rooms:
+                    chat_id = secrets.token_hex(8)
+                self._rooms[chat_id] = {
+                    "participants": list(pair),
+                    "created": datetime.now().isoformat(),
+                    "log": [],
+                    "lock": threading.Lock(),
+                }
+                self._by_pair[pair] = chat_id
+                for user_id in pair:
+                    self._by_user[user_id].append(chat_id)
+            return chat_id
+
+    def close_room(self, chat_id):
+        with self._lock:
+            room = self._rooms.pop(chat_id, None)
+            if room is None:
+                return
+            self._by_pair.pop(tuple(room["participants"]), None)
+            for user_id in room["participants"]:
+                self._by_user[user_id].remove(chat_id)
+                if not self._by_user[user_id]:
+                    del self._by_user[user_id]
+        self.broker.close(chat_id)
+
+    def rooms_for(self, user_id):
+        with self._lock:
+            return list(self._by_user.get(user_id, ()))
+
+    def participants(self, chat_id):
+        return list(self._rooms[chat_id]["participants"])
+
+    def append(self, chat_id, sender, text):
+        room = self._rooms[chat_id]
+        with room["lock"]:
+            message = PeerMessage(len(room["log"]), sys.intern(sender), text, now_epoch())
+            room["log"].append(message)
+        self.broker.publish(chat_id, message.seq)
+        return message.seq
+
+    def page(self, chat_id, before=None, limit=PEER_CHAT_PAGE_SIZE):
+        """Up to limit messages ending just before the cursor (default: the newest).
+
+        Returns (messages, cursor); pass the cursor back for the previous
+        page. The cursor is None once the start of the log is reached.
+        """
+        room = self._rooms[chat_id]
+        with room["lock"]:
+            end = len(room["log"]) if before is None else before
+            start = max(end - limit, 0)
+            return room["log"][start:end], (start if start > 0 else None)
+
+    def read(self, chat_id, start=0):
+        """Every message from seq start onwards"""
+        room = self._rooms[chat_id]
+        with room["lock"]:
+            return room["log"][start:]
+
+    def pending(self, subscriber_id, chat_id, next_seq):
+        """True if the room may hold messages from next_seq on that the subscriber hasn't read"""
+        return bool(self.broker.drain(subscriber_id, chat_id))
+
+class SharedPeerChatStore(PeerChatStore):
+    """PeerChatStore kept in SQLite (WAL), so rooms reach peers matched from other processes.
+
+    The broker only hears about messages sent from this process; pending
+    also checks the room's newest seq, so a poll picks up the rest.
+    """
+
+    def __init__(self, path, broker=None):
+        self.broker = broker or ChatBroker()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS peer_rooms ("
+                " chat_id TEXT PRIMARY KEY, user1 TEXT NOT NULL, user2 TEXT NOT NULL, created TEXT NOT NULL,"
+                " UNIQUE (user1, user2))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS peer_rooms_user2 ON peer_rooms(user2)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS peer_messages ("
+                " chat_id TEXT NOT NULL, seq INTEGER NOT NULL, sender TEXT NOT NULL, text TEXT NOT NULL,"
+                " created_at INTEGER NOT NULL, PRIMARY KEY (chat_id, seq)) WITHOUT ROWID"
+            )
+
+    def _query(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def open_room(self, user1, user2):
+        pair = tuple(sorted([user1, user2]))
+        with self._lock:
+            while True:
+                try:
+                    self._conn.execute(
+                        "INSERT INTO peer_rooms (chat_id, user1, user2, created) VALUES (?, ?, ?, ?)"
+                        " ON CONFLICT(user1, user2) DO NOTHING",
+                        (secrets.token_hex(8), *pair, datetime.now().isoformat()),
+                    )
+                    break
+                except sqlite3.IntegrityError:
+                    # The random chat_id is taken; draw another
+                    continue
+            return self._conn.execute(
+                "SELECT chat_id FROM peer_rooms WHERE user1 = ? AND user2 = ?", pair
+            ).fetchone()[0]
+
+    def close_room(self, chat_id):
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM peer_messages WHERE chat_id = ?", (chat_id,))
+            self._conn.execute("DELETE FROM peer_rooms WHERE chat_id = ?", (chat_id,))
+        self.broker.close(chat_id)
+
+    def rooms_for(self, user_id):
+        rows = self._query(
+            "SELECT chat_id FROM peer_rooms WHERE user1 = ? OR user2 = ? ORDER BY rowid", (user_id, user_id)
+        )
+        return [chat_id for chat_id, in rows]
+
+    def participants(self, chat_id):
+        rows = self._query("SELECT user1, user2 FROM peer_rooms WHERE chat_id = ?", (chat_id,))
+        if not rows:
+            raise KeyError(chat_id)
+        return list(rows[0])
+
+    def append(self, chat_id, sender, text):
+        created_at = now_epoch()
+        with self._lock:
+            # The seq is taken inside the insert, so two processes can't both claim it
+            seq, = self._conn.execute(
+                "INSERT INTO peer_messages (chat_id, seq, sender, text, created_at)"
+                " SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ?, ? FROM peer_messages WHERE chat_id = ? RETURNING seq",
+                (chat_id, sender, text, created_at, chat_id),
+            ).fetchone()
+        self.broker.publish(chat_id, seq)
+        return seq
+
+    def _messages(self, chat_id, start, stop):
+        rows = self._query(
+            "SELECT seq, sender, text, created_at FROM peer_messages WHERE chat_id = ? AND seq >= ? AND seq < ?"
+            " ORDER BY seq",
+            (chat_id, start, stop),
+        )
+        return [PeerMessage(seq, sys.intern(sender), text, created_at) for seq, sender, text, created_at in rows]
+
+    def _next_seq(self, chat_id):
+        return self._query("SELECT COALESCE(MAX(seq) + 1, 0) FROM peer_messages WHERE chat_id = ?", (chat_id,))[0][0]
+
+    def page(self, chat_id, before=None, limit=PEER_CHAT_PAGE_SIZE):
+        end = self._next_seq(chat_id) if before is None else before
+        start = max(end - limit, 0)
+        return self._messages(chat_id, start, end), (start if start > 0 else None)
+
+    def read(self, chat_id, start=0):
+        return self._messages(chat_id, start, sys.maxsize)
+
+    def pending(self, subscriber_id, chat_id, next_seq):
+        return super().pending(subscriber_id, chat_id, next_seq) or self._next_seq(chat_id) > next_seq
+
+@st.cache_resource(show_spinner=False)
+def get_chat_store():
+    # Peers matched from DMSPACE_PEER_DB may be served by another process, so their rooms live there too
+    return SharedPeerChatStore(PEER_DB_PATH) if PEER_DB_PATH else PeerChatStore()
 
 def create_peer_chat(user1, user2):
-    chat_id = hashlib.md5(f"{sorted([user1, user2])}".encode()).hexdigest()[:8]
-    
-    for cid in st.session_state.peer_chats:
-        if set(st.session_state.peer_chats[cid]["participants"]) == {user1, user2}:
-            return cid
-    
-    st.session_state.peer_chats[chat_id] = {
-        "participants": [user1, user2],
-        "messages": [],
-        "created": datetime.now().isoformat(),
-    }
-    return chat_id
+    return get_chat_store().open_room(user1, user2)
+
+TEST_PEER_IDS = ("user1", "user2", "user3", "user4", "user5", "user6")
 
 def create_test_profiles():
     test_data = {
@@ -566,9 +2660,10 @@ def create_test_profiles():
     }
     
     for user_id, data in test_data.items():
-        profile = create_profile(user_id, data["messages"])
+        messages = [ChatMessage(m["role"], m["content"]) for m in data["messages"]]
+        profile = create_profile(user_id, messages)
         if profile:
-            st.session_state.peers[user_id] = profile
+            get_peer_registry().put(profile)
 
 def show_test_controls():
     with st.expander("🧪 Testing Controls"):
@@ -583,15 +2678,15 @@ def show_test_controls():
                 create_test_profiles()
                 
                 # Opt in current user if they have a profile
-                if my_id in st.session_state.peers:
-                    st.session_state.peers[my_id]["opt_in"] = True
+                peers = get_peer_registry()
+                if my_id in peers:
+                    set_peer_opt_in(True)
                 
-                # Enable all other peers
-                for user_id in st.session_state.peers:
-                    if user_id != my_id:
-                        st.session_state.peers[user_id]["opt_in"] = True
+                # Enable the sample peers
+                for user_id in TEST_PEER_IDS:
+                    peers.set_opt_in(user_id, True)
                 
-                peer_count = len([u for u in st.session_state.peers if u != my_id])
+                peer_count = len([u for u in TEST_PEER_IDS if u in peers])
                 st.success(f"✅ Loaded {peer_count} peers! Go to Connect tab.")
                 st.rerun()
             
@@ -601,21 +2696,107 @@ def show_test_controls():
         
         with col2:
             if st.button("Clear All", use_container_width=True):
-                st.session_state.peers = {}
-                st.session_state.peer_chats = {}
+                # Peers are shared with other sessions, so only the sample ones go
+                for user_id in TEST_PEER_IDS:
+                    get_peer_registry().remove(user_id)
+                store = get_chat_store()
+                for chat_id in store.rooms_for(st.session_state.my_user_id):
+                    if set(store.participants(chat_id)) & set(TEST_PEER_IDS):
+                        store.close_room(chat_id)
+                        st.session_state.peer_chat_views.pop(chat_id, None)
                 st.rerun()
         
         with col3:
             if st.button("Reset Profile", use_container_width=True):
                 my_id = st.session_state.my_user_id
-                if my_id in st.session_state.peers:
-                    del st.session_state.peers[my_id]
-                st.session_state.messages = []
+                get_peer_registry().remove(my_id)
+                st.session_state.peer_opt_in = False
+                st.session_state.messages.clear()
+                st.session_state.theme_stats = new_theme_stats()
+                st.session_state.chat_window = CHAT_WINDOW_SIZE
+                st.session_state.conversation_summary = {"text": "", "folded": 0}
+                get_openai_runner().cancel(st.session_state.session_id, "summary")
+                save_session_value("theme_stats", "conversation_summary")
                 st.rerun()
 
+# Server-wide diagnostics are for operators: set DMSPACE_ADMIN_TOKEN and open the app with ?admin=<token>
+ADMIN_TOKEN = os.getenv("DMSPACE_ADMIN_TOKEN", "")
+
+def is_admin():
+    """True when the URL carries the configured admin token; never when none is set"""
+    token = st.query_params.get("admin", "")
+    return bool(ADMIN_TOKEN) and secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def show_diagnostics():
+    with st.expander("📊 Diagnostics"):
+        if DEMO_MODE:
+            st.caption("No OpenAI client in demo mode.")
+        else:
+            stats = get_pool_stats()
+            st.caption("**OpenAI connection pool**")
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Open", stats["open"])
+            col2.metric("Idle", stats["idle"])
+            col3.metric("In use", stats["in_use"])
+            st.caption(f"Limits: {stats['max_connections']} connections, {stats['max_keepalive']} keep-alive")
+
+            context_stats = st.session_state.get("context_stats")
+            if context_stats:
+                st.caption(f"**Last chat context:** ~{context_stats['tokens_sent']}/{context_stats['budget']} tokens sent • ~{context_stats['tokens_trimmed']} trimmed • {context_stats['messages_dropped']} messages dropped • {context_stats['messages_skipped']} skipped unmeasured")
+
+            cache = get_prompt_cache()
+            st.caption(f"**Journal prompt cache:** {len(cache)} entries • {cache.hits} hits • {cache.misses} misses")
+            st.caption(f"**Journal prefetch:** {get_journal_prefetcher().in_flight()} jobs in flight (max {JOURNAL_PREFETCH_MAX_IN_FLIGHT})")
+            runner = get_openai_runner()
+            st.caption(f"**OpenAI calls:** {runner.in_flight()} in flight • {runner.superseded} cancelled by a newer request")
+
+        inline_bytes, referenced_bytes = asset_bytes_per_rerun()
+        st.caption(f"**Theme + logo per rerun:** {referenced_bytes:,} bytes (was {inline_bytes:,} inline, saves {inline_bytes - referenced_bytes:,})")
+
+        store = get_session_store()
+        st.caption(f"**Storage:** {store.written:,}/{store.queued:,} writes on disk in {store.batches:,} batches • {store.failed_batches} retried • {store.dropped} dropped")
+        st.caption("**In memory:** " + " • ".join(
+            f"{kind} {st.session_state[kind].in_memory}/{len(st.session_state[kind])}" for kind in STORED_LOGS
+        ))
+
+        usage = session_memory_usage()
+        heaviest = sorted(usage.items(), key=lambda item: item[1], reverse=True)[:4]
+        st.caption(
+            f"**Session memory:** ~{sum(usage.values()):,} of {SESSION_MEMORY_BUDGET:,} bytes • "
+            f"{st.session_state.get('memory_keep', STORE_MEMORY_RECORDS)} records kept per history • heaviest: "
+            + ", ".join(f"{key} {size:,}" for key, size in heaviest)
+        )
+        if is_admin():
+            memory = get_session_memory()
+            sessions = memory.sessions()
+            st.caption(f"**All sessions:** ~{memory.total_bytes():,} bytes across {len(sessions)} • {memory.evicted} evicted after {memory.idle_seconds:.0f}s idle")
+            if sessions:
+                # Ids are truncated: the full id is the key to a session's history
+                st.dataframe([
+                    {
+                        "session": session_id[:6] + ("… (you)" if session_id == st.session_state.session_id else "…"),
+                        "bytes": nbytes,
+                        "idle_s": round(idle),
+                    }
+                    for session_id, nbytes, idle in sessions
+                ], hide_index=True)
+
+        timings = defaultdict(list)
+        for scope, ms in st.session_state.get("run_timings", ()):
+            timings[scope].append(ms)
+        if timings:
+            st.caption("**Script time per run** (\"app\" is a full rerun, the rest are scoped reruns)")
+            st.dataframe([
+                {"scope": scope, "runs": len(ms), "avg_ms": round(sum(ms) / len(ms), 1), "last_ms": round(ms[-1], 1)}
+                for scope, ms in timings.items()
+            ], hide_index=True)
+
+@st.fragment
+@timed("connect")
 def show_peer_support_tab():
     my_id = st.session_state.my_user_id
-    my_profile = st.session_state.peers.get(my_id)
+    peers = get_peer_registry()
+    my_profile = peers.get(my_id)
     
     col1, col2 = st.columns(2)
     
@@ -633,18 +2814,21 @@ def show_peer_support_tab():
             
             opt_in = st.checkbox("✅ Open to peer connections", value=my_profile.get("opt_in"), key="peer_optin")
             if opt_in != my_profile.get("opt_in"):
-                st.session_state.peers[my_id]["opt_in"] = opt_in
-                st.rerun()
+                set_peer_opt_in(opt_in)
+                rerun_fragment()
         else:
             st.info("💭 Chat more to build your profile")
     
     with col2:
-        matches = find_matches(my_id) if my_profile and my_profile.get("opt_in") else []
+        matches = find_matches(my_id, k=MATCH_LIMIT) if my_profile and my_profile.get("opt_in") else []
+        # Another session can remove a match (eviction, expiry, reset) before it's shown
+        profiles = {other_id: peers.get(other_id) for other_id, _ in matches}
+        matches = [(other_id, score) for other_id, score in matches if profiles[other_id]]
         
         if matches:
-            st.markdown(f"✨ **Found {len(matches)} match(es)**")
-            for other_id, score in matches[:3]:
-                other = st.session_state.peers[other_id]
+            st.markdown(f"✨ **Top {len(matches)} match(es)**")
+            for other_id, score in matches:
+                other = profiles[other_id]
                 themes = ", ".join([t[0] for t in other.get("top_themes", [])])
                 
                 col_a, col_b = st.columns([3, 1])
@@ -654,48 +2838,88 @@ def show_peer_support_tab():
                     if st.button("Connect", key=other_id, use_container_width=True):
                         chat_id = create_peer_chat(my_id, other_id)
                         st.session_state.current_peer_chat = chat_id
-                        st.rerun()
+                        rerun_fragment()
         else:
             st.info("👤 Opt in to see matches")
     
     st.divider()
     
-    if st.session_state.peer_chats:
-        for chat_id, chat_data in st.session_state.peer_chats.items():
-            other_user = [u for u in chat_data["participants"] if u != my_id][0]
-            is_new = st.session_state.get("current_peer_chat") == chat_id
+    # The chat panel refreshes on its own, so new peer messages don't rerun the app
+    has_rooms = bool(get_chat_store().rooms_for(my_id))
+    polling = has_rooms or bool(my_profile and my_profile.get("opt_in"))
+    st.fragment(show_peer_chats, run_every=PEER_CHAT_POLL_SECONDS if polling else None)(my_id)
+
+def send_peer_message(chat_id, sender):
+    text = (st.session_state.get(f"peer_chat_{chat_id}") or "").strip()
+    if text:
+        get_chat_store().append(chat_id, sender, text)
+
+def load_peer_chat_view(store, chat_id, my_id):
+    """This session's window on a room, topped up with anything published since the last refresh"""
+    views = st.session_state.peer_chat_views
+    view = views.get(chat_id)
+    if view is None:
+        # Subscribe first so nothing published during the first read is missed
+        store.broker.subscribe(my_id, chat_id)
+        messages, cursor = store.page(chat_id)
+        view = views[chat_id] = {
+            "messages": messages,
+            "cursor": cursor,
+            "next_seq": messages[-1].seq + 1 if messages else 0,
+        }
+    elif store.pending(my_id, chat_id, view["next_seq"]):
+        new_messages = store.read(chat_id, view["next_seq"])
+        if new_messages:
+            view["messages"] = view["messages"] + new_messages
+            view["next_seq"] = new_messages[-1].seq + 1
+    return view
+
+def show_peer_chats(my_id):
+    # Polls don't account memory, but a user waiting on a peer isn't idle
+    if is_fragment_run() and not get_session_memory().touch(st.session_state.session_id):
+        track_session_memory()
+    store = get_chat_store()
+    for chat_id in store.rooms_for(my_id):
+        other_user = [u for u in store.participants(chat_id) if u != my_id][0]
+        is_new = st.session_state.get("current_peer_chat") == chat_id
+        view = load_peer_chat_view(store, chat_id, my_id)
+        
+        with st.expander(f"💬 Chat with {other_user}", expanded=is_new):
+            if view["cursor"] is not None and st.button("Load earlier", key=f"peer_earlier_{chat_id}"):
+                earlier, view["cursor"] = store.page(chat_id, before=view["cursor"])
+                view["messages"] = earlier + view["messages"]
+
+            if view["messages"]:
+                for msg in view["messages"]:
+                    with st.chat_message("user" if msg.sender == my_id else "assistant"):
+                        st.write(msg.text)
+            else:
+                st.caption("Start with something kind...")
             
-            with st.expander(f"💬 Chat with {other_user}", expanded=is_new):
-                if chat_data["messages"]:
-                    for msg in chat_data["messages"]:
-                        role = "You" if msg["sender"] == my_id else "Peer"
-                        with st.chat_message("user" if msg["sender"] == my_id else "assistant"):
-                            st.write(msg["text"])
-                else:
-                    st.caption("Start with something kind...")
-                
-                new_msg = st.chat_input("Type a message...", key=f"peer_chat_{chat_id}")
-                if new_msg and new_msg.strip():
-                    chat_data["messages"].append({
-                        "sender": my_id,
-                        "text": new_msg.strip(),
-                        "time": datetime.now().isoformat()
-                    })
-                    st.rerun()
+            st.chat_input(
+                "Type a message...", key=f"peer_chat_{chat_id}",
+                on_submit=send_peer_message, args=(chat_id, my_id),
+            )
 
 #Session state initialization
 
 if "openai_model" not in st.session_state:
     st.session_state["openai_model"] = DEFAULT_MODEL
 
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# Histories and counters come back from the store on reload or reconnect,
+# and are refreshed every run in case another tab of the session wrote them
+load_session_state()
 
-if "emotion_log" not in st.session_state:
-    st.session_state.emotion_log = []
+if "chat_window" not in st.session_state:
+    st.session_state.chat_window = CHAT_WINDOW_SIZE
 
-if "journal_entries" not in st.session_state:
-    st.session_state.journal_entries = []
+if "theme_stats" not in st.session_state:
+    st.session_state.theme_stats = compute_theme_stats(st.session_state.messages)
+
+if "conversation_summary" not in st.session_state:
+    st.session_state.conversation_summary = {"text": "", "folded": 0}
+# A summary written in the background since the last run is picked up before the next reply
+collect_conversation_summary()
 
 init_peer_state()
 init_game_state()
@@ -708,264 +2932,39 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Professional app styling
-st.markdown("""
-<style>
-    [data-testid="stAppViewContainer"] {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 50%, #5a6c8a 100%);
-        background-attachment: fixed;
-    }
-    
-    [data-testid="stMainBlockContainer"] {
-        padding: 3rem 3rem 2rem 3rem !important;
-    }
-    
-    .main { padding: 0 !important; }
-    
-    h1 {
-        color: #ffffff !important;
-        text-align: center;
-        font-size: 2.8rem !important;
-        font-weight: 800 !important;
-        margin: 0 !important;
-        padding: 0 !important;
-        letter-spacing: -1px;
-        text-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
-    }
-    
-    h2, h3 { color: rgba(255, 255, 255, 0.95) !important; font-weight: 700 !important; font-size: 1.3rem !important; }
-    p, label, span { color: rgba(255, 255, 255, 0.9) !important; font-size: 1.05rem !important; }
-    
-    [role="tablist"] {
-        gap: 0;
-        border-bottom: 2px solid rgba(255, 255, 255, 0.15) !important;
-        background: rgba(255, 255, 255, 0.05);
-        margin-bottom: 2rem !important;
-        border-radius: 12px 12px 0 0;
-    }
-    
-    [role="tab"] {
-        padding: 1.5rem 2.5rem !important;
-        font-size: 18px !important;
-        color: rgba(255, 255, 255, 0.6) !important;
-        border: none !important;
-        border-bottom: 3px solid transparent !important;
-        transition: all 0.3s ease;
-        font-weight: 700;
-    }
-    
-    [role="tab"][aria-selected="true"] {
-        color: #ffffff !important;
-        border-bottom-color: #ffffff !important;
-        background: rgba(255, 255, 255, 0.08);
-    }
-    
-    input, textarea {
-        background: rgba(20, 20, 40, 0.8) !important;
-        border: 2px solid rgba(102, 126, 234, 0.5) !important;
-        border-radius: 10px !important;
-        color: #ffffff !important;
-        padding: 12px 16px !important;
-        font-size: 16px !important;
-    }
-    
-    input:focus, textarea:focus {
-        background: rgba(20, 20, 40, 0.95) !important;
-        border-color: rgba(102, 126, 234, 0.9) !important;
-        color: #ffffff !important;
-    }
-    
-    input::placeholder {
-        color: rgba(255, 255, 255, 0.5) !important;
-    }
-    
-    [data-testid="stChatInputContainer"] input {
-        background: rgba(255, 255, 255, 0.15) !important;
-        border: 1px solid rgba(255, 255, 255, 0.3) !important;
-    }
-    
-    [data-testid="stChatMessage"] {
-        background: transparent;
-        padding: 1.2rem 0;
-    }
-    
-    [data-testid="stChatMessage"] [data-testid="stMarkdownContainer"] {
-        color: #ffffff;
-        line-height: 1.6;
-    }
-    
-    button {
-        border-radius: 10px !important;
-        font-weight: 600 !important;
-        transition: all 0.3s ease !important;
-        border: none !important;
-        font-size: 16px !important;
-    }
-    
-    button[kind="secondary"] {
-        background: rgba(255, 255, 255, 0.15) !important;
-        color: #ffffff !important;
-        border: 1px solid rgba(255, 255, 255, 0.25) !important;
-    }
-    
-    button[kind="secondary"]:hover {
-        background: rgba(255, 255, 255, 0.25) !important;
-        transform: translateY(-1px) !important;
-    }
-    
-    button[kind="primary"] {
-        background: linear-gradient(135deg, rgba(255, 255, 255, 0.2) 0%, rgba(255, 255, 255, 0.1) 100%) !important;
-        color: #ffffff !important;
-        border: 1px solid rgba(255, 255, 255, 0.3) !important;
-    }
-    
-    button[kind="primary"]:hover {
-        background: linear-gradient(135deg, rgba(255, 255, 255, 0.3) 0%, rgba(255, 255, 255, 0.2) 100%) !important;
-        transform: translateY(-1px) !important;
-    }
-    
-    [data-testid="stAlert"] {
-        background: rgba(255, 255, 255, 0.12) !important;
-        border: 1px solid rgba(255, 255, 255, 0.25) !important;
-        border-radius: 10px !important;
-        color: rgba(255, 255, 255, 0.95) !important;
-    }
-    
-    hr { border: 1px solid rgba(255, 255, 255, 0.15) !important; }
-    
-    [data-testid="stExpander"] {
-        border: 1px solid rgba(255, 255, 255, 0.15) !important;
-        border-radius: 10px !important;
-        background: rgba(255, 255, 255, 0.05);
-    }
-    
-    .caption { color: rgba(255, 255, 255, 0.65) !important; font-size: 15px !important; }
-    
-    /* Sidebar styling */
-    [data-testid="stSidebar"] {
-        background: linear-gradient(135deg, rgba(20, 20, 50, 0.95) 0%, rgba(40, 40, 70, 0.95) 100%) !important;
-    }
-    
-    [data-testid="stSidebar"] h3, 
-    [data-testid="stSidebar"] h4 {
-        color: #ffffff !important;
-        font-weight: 700 !important;
-    }
-    
-    [data-testid="stSidebar"] p,
-    [data-testid="stSidebar"] label,
-    [data-testid="stSidebar"] span {
-        color: rgba(255, 255, 255, 0.9) !important;
-        font-size: 1rem !important;
-    }
-    
-    [data-testid="stSidebar"] .caption {
-        color: rgba(255, 255, 255, 0.7) !important;
-        font-size: 14px !important;
-    }
-    
-    [data-testid="stSidebar"] [role="radio"] {
-        color: #ffffff !important;
-    }
-    
-    [data-testid="stSidebar"] input {
-        background: rgba(255, 255, 255, 0.15) !important;
-        border: 1px solid rgba(102, 126, 234, 0.5) !important;
-        color: #ffffff !important;
-    }
-    
-    [data-testid="stSidebar"] button {
-        background: rgba(102, 126, 234, 0.3) !important;
-        border: 1px solid rgba(102, 126, 234, 0.6) !important;
-        color: #ffffff !important;
-    }
-    
-    [data-testid="stSidebar"] button:hover {
-        background: rgba(102, 126, 234, 0.5) !important;
-        border-color: rgba(102, 126, 234, 0.8) !important;
-    }
-    
-    /* Sidebar toggle button - make it dark and visible */
-    button[kind="tertiary"] {
-        color: #000000 !important;
-        background: #333333 !important;
-        border: 1px solid #555555 !important;
-    }
-    
-    button[kind="tertiary"]:hover {
-        background: #444444 !important;
-        border-color: #666666 !important;
-        color: #ffffff !important;
-    }
-    
-    [data-testid="stSidebarNav"] {
-        background: transparent !important;
-    }
-    
-    [data-testid="stSidebarNav"] button {
-        color: #ffffff !important;
-    }
-    
-    html { scroll-behavior: smooth; }
-    
-    /* Style Streamlit top header bar - make it dark */
-    header[data-testid="stHeader"] {
-        background-color: #1a1a2e !important;
-    }
-    
-    /* Entire header section */
-    [data-testid="stApp"] header {
-        background-color: #1a1a2e !important;
-        background-image: none !important;
-    }
-    
-    /* Top toolbar with Deploy, Rerun buttons */
-    [data-testid="stToolbar"] {
-        background-color: #1a1a2e !important;
-    }
-    
-    /* Make text in header white/visible */
-    [data-testid="stHeader"] button,
-    [data-testid="stHeader"] span,
-    [data-testid="stHeader"] div {
-        color: #ffffff !important;
-    }
-    
-    /* Toolbar buttons text */
-    [data-testid="stToolbar"] button {
-        color: #ffffff !important;
-    }
-    
-    /* Force sidebar toggle button to be dark */
-    [data-testid="baseButton-secondary"] {
-        background-color: #1a1a1a !important;
-        color: #ffffff !important;
-        border: 2px solid #333333 !important;
-    }
-    
-    [data-testid="baseButton-secondary"]:hover {
-        background-color: #333333 !important;
-        color: #ffffff !important;
-    }
-    
-    /* Alternative targeting for hamburger menu */
-    button[data-testid*="stSidebar"] {
-        background: #1a1a1a !important;
-        color: #ffffff !important;
-    }
-    
-    /* Target any button in top area */
-    [data-testid="stApp"] > header button {
-        background-color: #1a1a1a !important;
-        color: #ffffff !important;
-        border: 1px solid #333333 !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Professional app styling, served as a cached static file
+asset_urls = static_asset_urls()
+st.markdown(asset_stylesheet_markup(asset_urls), unsafe_allow_html=True)
 
 #Sidebar
 
+@st.fragment
+@timed("sidebar")
+def show_sidebar_tools():
+    st.markdown("---")
+    st.subheader("ℹ️ About")
+    st.caption("A culturally-informed space for mental wellness, games, and peer support.")
+    st.markdown("---")
+    show_test_controls()
+    show_diagnostics()
+
+def show_account():
+    """Sign-in controls; only a signed-in account keeps its history after the tab closes"""
+    if not auth_configured():
+        st.caption("🔒 Your history is kept for this visit only.")
+    elif st.session_state.get("signed_in"):
+        name = st.user.get("name") or st.user.get("email") or "your account"
+        st.caption(f"🔒 Signed in as {name}. Your history is kept with your account.")
+        if st.button("Sign out", use_container_width=True):
+            st.logout()
+    else:
+        st.caption("🔒 As a guest, your history is kept for this visit only.")
+        if st.button("Sign in to keep your history", use_container_width=True):
+            st.login()
+
 with st.sidebar:
+    show_account()
+    # Outside the fragment: the perspective changes chat and journal, so it reruns the app
     st.markdown("---")
     st.subheader("🌍 Your Perspective")
     st.session_state.cultural_context = st.radio(
@@ -976,11 +2975,7 @@ with st.sidebar:
     )
     st.caption(f"*{CULTURAL_CONTEXTS[st.session_state.cultural_context]['reflection_style']}*")
     
-    st.markdown("---")
-    st.subheader("ℹ️ About")
-    st.caption("A culturally-informed space for mental wellness, games, and peer support.")
-    st.markdown("---")
-    show_test_controls()
+    show_sidebar_tools()
 
 #Main layout with logo
 
@@ -991,34 +2986,7 @@ st.markdown("<div style='margin-top: 2rem;'></div>", unsafe_allow_html=True)
 
 col1, col2, col3 = st.columns([1, 1.5, 1])
 with col2:
-    st.markdown("""
-    <div style="text-align: center; margin-bottom: 3rem;">
-        <svg width="120" height="120" viewBox="0 0 200 200" xmlns="http://www.w3.org/2000/svg">
-          <defs>
-            <linearGradient id="grad1" x1="0%" y1="0%" x2="100%" y2="100%">
-              <stop offset="0%" style="stop-color:#ffffff;stop-opacity:0.9" />
-              <stop offset="100%" style="stop-color:#e0e7ff;stop-opacity:0.9" />
-            </linearGradient>
-            <linearGradient id="grad2" x1="0%" y1="0%" x2="100%" y2="100%">
-              <stop offset="0%" style="stop-color:#c7d2fe;stop-opacity:0.9" />
-              <stop offset="100%" style="stop-color:#a5b4fc;stop-opacity:0.9" />
-            </linearGradient>
-            <filter id="shadow">
-              <feDropShadow dx="0" dy="4" stdDeviation="6" flood-opacity="0.4"/>
-            </filter>
-          </defs>
-          <circle cx="100" cy="100" r="95" fill="none" stroke="rgba(255,255,255,0.2)" stroke-width="2"/>
-          <circle cx="60" cy="100" r="28" fill="url(#grad1)" filter="url(#shadow)"/>
-          <circle cx="140" cy="100" r="28" fill="url(#grad2)" filter="url(#shadow)"/>
-          <circle cx="100" cy="60" r="28" fill="url(#grad1)" filter="url(#shadow)"/>
-          <line x1="60" y1="100" x2="100" y2="60" stroke="rgba(255,255,255,0.6)" stroke-width="3"/>
-          <line x1="100" y1="60" x2="140" y2="100" stroke="rgba(255,255,255,0.6)" stroke-width="3"/>
-          <line x1="140" y1="100" x2="60" y2="100" stroke="rgba(255,255,255,0.6)" stroke-width="3"/>
-          <circle cx="100" cy="100" r="14" fill="rgba(102, 126, 234, 0.8)" filter="url(#shadow)"/>
-          <circle cx="100" cy="100" r="11" fill="none" stroke="rgba(255,255,255,0.8)" stroke-width="2"/>
-        </svg>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(asset_logo_markup(asset_urls), unsafe_allow_html=True)
 
 st.markdown("<h1 style='text-align: center; font-size: 14rem; color: #ffffff; margin: -1rem 0 0 0; padding: 0; font-weight: 800; letter-spacing: -4px;'>DMSpace</h1>", unsafe_allow_html=True)
 st.markdown("<div style='margin-bottom: 2rem;'></div>", unsafe_allow_html=True)
@@ -1028,10 +2996,20 @@ chat_tab, journal_tab, peer_tab, games_tab = st.tabs(["💭 Chat", "📔 Journal
 
 # --- CHAT TAB ---
 
-with chat_tab:
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+@st.fragment
+@timed("chat")
+def show_chat_tab():
+    # Only the newest messages are rendered; older ones load on request
+    hidden = len(st.session_state.messages) - st.session_state.chat_window
+    if hidden > 0:
+        st.button(
+            f"⬆️ Load earlier messages ({hidden} more)", key="chat_load_earlier",
+            on_click=widen_chat_window, use_container_width=True,
+        )
+
+    for message in st.session_state.messages[-st.session_state.chat_window:]:
+        with st.chat_message(message.role):
+            st.markdown(message.content)
 
     prompt = st.chat_input("What's on your mind?")
 
@@ -1041,62 +3019,65 @@ with chat_tab:
         if not clean_prompt:
             st.info("Share something to continue.")
         else:
-            st.session_state.messages.append({"role": "user", "content": clean_prompt})
+            add_chat_message("user", clean_prompt)
 
             if is_possible_crisis(clean_prompt):
-                st.session_state.messages.append({"role": "assistant", "content": CRISIS_RESPONSE})
+                add_chat_message("assistant", CRISIS_RESPONSE)
             else:
                 assistant_reply = generate_assistant_reply(st.session_state.messages)
 
                 if assistant_reply is not None:
-                    st.session_state.messages.append({"role": "assistant", "content": assistant_reply})
+                    add_chat_message("assistant", assistant_reply)
 
-                    st.session_state.emotion_log.append({
-                        "user_text": clean_prompt,
-                        "assistant_text": assistant_reply,
-                        "timestamp": datetime.now().strftime("%b %d, %Y • %I:%M %p"),
-                    })
+                    st.session_state.emotion_log.append(EmotionEntry(clean_prompt, assistant_reply, now_epoch()))
+                    update_conversation_summary(st.session_state.messages)
+                    generate_journal_prompts(st.session_state.emotion_log)
                     
                     if len(st.session_state.messages) >= 2:
-                        profile = create_profile(st.session_state.my_user_id, st.session_state.messages)
-                        if profile:
-                            st.session_state.peers[st.session_state.my_user_id] = profile
+                        publish_profile()
                 
                 st.rerun()
 
+with chat_tab:
+    show_chat_tab()
+
 # --- JOURNAL TAB ---
 
-with journal_tab:
+@st.fragment
+@timed("journal")
+def show_journal_tab():
     if not st.session_state.emotion_log:
         st.info("Chat to unlock personalized journal prompts")
     else:
         with st.expander("📋 Today's Prompts", expanded=True):
-            ai_prompts = generate_journal_prompts(st.session_state.emotion_log)
-            if ai_prompts:
-                st.markdown(ai_prompts)
+            # Poll for the background result only while a job is in flight
+            generate_journal_prompts(st.session_state.emotion_log)
+            pending = get_journal_prefetcher().is_pending(st.session_state.session_id)
+            st.fragment(show_journal_prompts, run_every=JOURNAL_PREFETCH_POLL_SECONDS if pending else None)(pending)
         
         st.markdown("")
     
     col1, col2 = st.columns([1, 3])
     with col1:
-        mood = st.select_slider("Mood", options=["😞", "😐", "🙂", "😊", "😌", "💪"])
+        mood = st.select_slider("Mood", options=JOURNAL_MOODS)
     
     journal_text = st.text_area("Write your thoughts", key="journal_input", height=150)
     highlight = st.text_input("One thing to remember", key="journal_highlight")
 
     if st.button("Save", use_container_width=True):
         if journal_text.strip() or highlight.strip():
-            st.session_state.journal_entries.append({
-                "text": journal_text.strip(),
-                "highlight": highlight.strip(),
-                "mood": mood,
-                "timestamp": datetime.now().strftime("%b %d, %Y • %I:%M %p"),
-            })
+            st.session_state.journal_entries.append(
+                JournalEntry(journal_text.strip(), highlight.strip(), mood, now_epoch())
+            )
             st.success("Saved ✓")
         else:
             st.info("Write something first")
 
+    show_trends()
+
     if st.session_state.journal_entries:
+        show_journal_search()
+
         st.divider()
         st.markdown("### Past Entries")
         
@@ -1104,15 +3085,105 @@ with journal_tab:
             with st.container():
                 col1, col2 = st.columns([1, 5])
                 with col1:
-                    st.markdown(f"**{entry['mood']}**")
-                    st.caption(entry['timestamp'])
+                    st.markdown(f"**{entry.mood}**")
+                    st.caption(format_timestamp(entry.created_at))
                 with col2:
-                    if entry.get("highlight"):
-                        st.markdown(f"__{entry['highlight']}__")
-                    if entry.get("text"):
-                        st.caption(entry["text"][:120] + "..." if len(entry["text"]) > 120 else entry["text"])
+                    if entry.highlight:
+                        st.markdown(f"__{entry.highlight}__")
+                    if entry.text:
+                        st.caption(entry.text[:120] + "..." if len(entry.text) > 120 else entry.text)
                 st.divider()
 
+def show_trends():
+    """Weekly mood, chat themes and gratitude, from the per-day aggregates"""
+    if not any(len(st.session_state[kind]) for kind in DAILY_METRIC_PREFIXES):
+        return
+    with st.expander("📈 Trends"):
+        span = st.radio("Range", list(TREND_RANGES), horizontal=True, key="trend_range", label_visibility="collapsed")
+        weeks = TREND_RANGES[span]
+        trends = get_trends()
+
+        st.markdown("**Mood per week**")
+        moods = trend_series(trends, "mood:", weeks)
+        if moods:
+            st.bar_chart(moods, x="week", y=[m for m in JOURNAL_MOODS if m in moods], height=220)
+        else:
+            st.caption("Save journal entries to see your moods here.")
+
+        st.markdown(f"**Themes in chat** ({TREND_AVERAGE_WEEKS}-week average)")
+        themes = trend_series(trends, "theme:", weeks, averaged=True)
+        if themes:
+            st.line_chart(themes, x="week", height=220)
+        else:
+            st.caption("Themes show up here as you chat.")
+
+        st.markdown("**Gratitude per week**")
+        gratitude = trend_series(trends, "gratitude", weeks)
+        if gratitude:
+            average = trend_series(trends, "gratitude", weeks, averaged=True)
+            gratitude[f"{TREND_AVERAGE_WEEKS}-week average"] = average["gratitude"]
+            st.line_chart(gratitude, x="week", height=220)
+        else:
+            st.caption("Add to your gratitude jar to see your rhythm here.")
+
+def show_journal_search():
+    """Search every past entry, a page at a time"""
+    with st.expander("🔎 Search past entries"):
+        query = st.text_input("Words", key="journal_search_query", placeholder="e.g. work, sleep, mom")
+        col1, col2 = st.columns(2)
+        with col1:
+            moods = st.multiselect("Mood", JOURNAL_MOODS, key="journal_search_moods")
+        with col2:
+            dates = st.date_input("Between", value=(), key="journal_search_dates")
+
+        # The picked days are the user's, so their midnights are too
+        since = until = None
+        if dates:
+            tz = user_timezone()
+            since = datetime(dates[0].year, dates[0].month, dates[0].day, tzinfo=tz).timestamp()
+            last = dates[-1] + timedelta(days=1)
+            until = datetime(last.year, last.month, last.day, tzinfo=tz).timestamp()
+
+        # Changing the filters starts over from the newest page
+        filters = (query, tuple(moods), since, until)
+        search = st.session_state.get("journal_search")
+        if not search or search["filters"] != filters:
+            search = st.session_state.journal_search = {"filters": filters, "cursors": [None]}
+        if not (query.strip() or moods or dates):
+            return
+
+        entries, next_cursor = get_session_store().search_journal(
+            st.session_state.session_id, query, moods, since, until, cursor=search["cursors"][-1]
+        )
+        page = len(search["cursors"])
+        if not entries:
+            st.caption("No entries match.")
+        for entry in entries:
+            col1, col2 = st.columns([1, 5])
+            with col1:
+                st.markdown(f"**{entry['mood']}**")
+                st.caption(format_timestamp(entry["created_at"]))
+            with col2:
+                if entry["highlight"]:
+                    st.markdown(entry["highlight"])
+                if entry["text"]:
+                    st.caption(entry["text"])
+
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            if st.button("⬅️ Newer", key="journal_search_newer", disabled=page == 1, use_container_width=True):
+                search["cursors"].pop()
+                rerun_fragment()
+        with col2:
+            st.caption(f"Page {page}")
+        with col3:
+            if st.button("Older ➡️", key="journal_search_older", disabled=next_cursor is None, use_container_width=True):
+                search["cursors"].append(next_cursor)
+                rerun_fragment()
+
+with journal_tab:
+    show_journal_tab()
+
 # --- PEER SUPPORT TAB ---
 
 with peer_tab:
@@ -1120,7 +3191,9 @@ with peer_tab:
 
 # --- GAMES TAB ---
 
-with games_tab:
+@st.fragment
+@timed("games")
+def show_games_tab():
     st.markdown("## 🎮 Wellness Games")
     st.caption("Play games for mental wellness. Pick one to get started!")
     st.divider()
@@ -1130,17 +3203,14 @@ with games_tab:
     with col1:
         if st.button("🔍 Word Detective", use_container_width=True, key="select_word_game"):
             st.session_state.current_game = "word"
-            st.rerun()
     
     with col2:
         if st.button("🏺 Gratitude Jar", use_container_width=True, key="select_gratitude_game"):
             st.session_state.current_game = "gratitude"
-            st.rerun()
     
     with col3:
         if st.button("🫁 Breathing Exercise", use_container_width=True, key="select_breathing_game"):
             st.session_state.current_game = "breathing"
-            st.rerun()
     
     st.divider()
     
@@ -1154,4 +3224,10 @@ with games_tab:
     elif st.session_state.current_game == "breathing":
         show_breathing_exercise()
     else:
-        st.info("👆 Select a game above to start!")
\ No newline at end of file
+        st.info("👆 Select a game above to start!")
+
+with games_tab:
+    show_games_tab()
+
+record_run_time("app", APP_RUN_STARTED)
+track_session_memory()
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# dmspace.py is a Streamlit script: importing it runs the app in bare mode,
+# so point its SQLite store somewhere disposable first
+os.environ.setdefault("DMSPACE_DB", os.path.join(tempfile.mkdtemp(prefix="dmspace-tests-"), "dmspace.db"))
+os.environ.pop("OPENAI_API_KEY", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
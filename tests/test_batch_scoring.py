@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import dmspace
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    profiles = dmspace.random_profiles(500, seed=1)
+    # Edge cases the random ones may miss: no themes, and both stage extremes
+    profiles.append({**profiles[0], "user_id": "no-themes", "top_themes": []})
+    for stage in dmspace.PROFILE_STAGES:
+        profiles.append({**profiles[1], "user_id": f"stage-{stage}", "stage": stage})
+    return profiles
+
+
+def test_batch_scores_match_match_score(profiles):
+    batch = dmspace.ProfileBatch(profiles)
+    for query in profiles[:50] + profiles[-4:]:
+        expected = np.array([dmspace.match_score(query, other) for other in profiles])
+        np.testing.assert_array_equal(batch.scores(query), expected)
+
+
+def test_pairwise_scores_match_match_score(profiles):
+    batch = dmspace.ProfileBatch(profiles)
+    expected = np.array([[dmspace.match_score(a, b) for b in profiles] for a in profiles])
+    # A small block size forces several blocks, including a ragged last one
+    blocks = list(dmspace.pairwise_scores(batch.masks, batch.stages, block_elements=len(profiles) * 37))
+    assert len(blocks) > 1
+    for first_row, block in blocks:
+        np.testing.assert_array_equal(block, expected[first_row:first_row + len(block)])
+    assert sum(len(block) for _, block in blocks) == len(profiles)